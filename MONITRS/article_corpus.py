@@ -0,0 +1,113 @@
+# articles shared between events, each fetched and summarized once however many events link it
+
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# query parameters that only track where a click came from
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid')
+
+
+def canonical_url(url):
+    """Normalize a url so the same article found for several events has one key.
+
+    Drops the fragment and tracking parameters and lowercases the scheme and host,
+    the path and the other parameters are kept as they are.
+    """
+    parts = urlsplit(url.strip())
+    query = parts.query
+    params = parse_qsl(query, keep_blank_values=True)
+    kept = [(k, v) for k, v in params if not k.lower().startswith(TRACKING_PARAMS)]
+    # re-encoding may change the escaping, so the query is only rebuilt when something is dropped
+    if len(kept) != len(params):
+        query = urlencode(kept)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
+
+
+class ArticleCorpus:
+    """Which events link which articles, and the locations extracted from shared articles.
+
+    The search results of adjacent counties or of the same storm often share news
+    articles. The text of an article is kept once in the ArticleStore, and the
+    locations gemini finds in an article linked by several events are stored here,
+    so it is sent to gemini once. Concurrent events asking for the same article
+    wait for the first one instead of sending their own request.
+
+    Args:
+        path (str): Path to the SQLite database.
+    """
+
+    def __init__(self, path='article_corpus.sqlite'):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS article_locations (url TEXT PRIMARY KEY, locations TEXT, created_at REAL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS event_articles (event INTEGER, url TEXT, PRIMARY KEY (event, url))")
+        self.conn.commit()
+
+    def link(self, event, urls):
+        # record that an event uses these articles
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO event_articles VALUES (?, ?)", [(event, url) for url in urls])
+            self.conn.commit()
+
+    def shared_urls(self):
+        # urls linked by more than one event
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT url FROM event_articles GROUP BY url HAVING COUNT(*) > 1")}
+
+    def get_locations(self, url):
+        """Return the stored locations of an article, or None if it was never summarized."""
+        with self.lock:
+            row = self.conn.execute("SELECT locations FROM article_locations WHERE url = ?", (url,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put_locations(self, url, locations):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO article_locations VALUES (?, ?, ?)",
+                              (url, json.dumps(list(locations)), time.time()))
+            self.conn.commit()
+
+    def locations(self, url, content, extract):
+        """Locations of an article, extracted at most once.
+
+        Args:
+            url (str): Canonical url of the article.
+            content (str): Text of the article.
+            extract (callable): Called with ``content`` on a miss, returns a list of
+                location names. Exceptions are not stored, the next caller retries.
+
+        Returns:
+            list: Location names found in the article.
+        """
+        while True:
+            locations = self.get_locations(url)
+            if locations is not None:
+                return locations
+            with self.lock:
+                done = self.in_flight.get(url)
+                if done is None:
+                    done = self.in_flight[url] = threading.Event()
+                    break
+            # another event is summarizing this article, use its result (or retry if it failed)
+            done.wait()
+        try:
+            locations = extract(content)
+            self.put_locations(url, locations)
+            return locations
+        finally:
+            with self.lock:
+                self.in_flight.pop(url, None)
+            done.set()
+
+    def stats(self):
+        """Return (unique articles, event links to them, articles summarized)."""
+        with self.lock:
+            articles, links = self.conn.execute("SELECT COUNT(DISTINCT url), COUNT(*) FROM event_articles").fetchone()
+            summarized = self.conn.execute("SELECT COUNT(*) FROM article_locations").fetchone()[0]
+        return articles, links, summarized
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,110 @@
+# pooled downloader for the news articles linked from each event
+
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from html_extract import get_extractor
+
+
+def make_session(pool_size=32):
+    """Create a requests session that keeps connections alive across articles.
+
+    Args:
+        pool_size (int): Maximum number of keep-alive connections per host.
+
+    Returns:
+        requests.Session: Session with a pooled adapter mounted for http and https.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; MONITRS/1.0)'
+    return session
+
+
+class ArticleFetcher:
+    """Fetch articles concurrently over a shared session.
+
+    Args:
+        workers (int): Number of download threads.
+        per_domain (int): Maximum concurrent requests to a single domain.
+        timeout (tuple): (connect, read) timeout in seconds for each request.
+        store (ArticleStore): Optional article store served before the network.
+        extractor (str): Name of the html extraction backend, see ``html_extract.EXTRACTORS``.
+    """
+
+    def __init__(self, workers=16, per_domain=2, timeout=(5, 20), store=None, extractor=None):
+        self.timeout = timeout
+        self.store = store
+        self.extract = get_extractor(extractor)
+        self.session = make_session(workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.domain_limits = defaultdict(lambda: threading.BoundedSemaphore(per_domain))
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def _domain_limit(self, url):
+        with self.lock:
+            return self.domain_limits[urlparse(url).netloc]
+
+    def fetch(self, url):
+        """Download and parse a single article.
+
+        Returns:
+            tuple: (title, content), or (None, None) if the request failed.
+        """
+        if self.store is not None:
+            article = self.store.get(url)
+            if article is not None:
+                return article['title'], article['content']
+        print(f"Getting article content from {url}")
+        try:
+            with self._domain_limit(url):
+                response = self.session.get(url, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching {url}: {e}")
+            return None, None
+        if response.status_code != 200:
+            return None, None
+        title, content = self.extract(response.text)
+        if self.store is not None:
+            self.store.put(url, response.text, title, content)
+        return title, content
+
+    def _future(self, url):
+        # events linking the same article while it is being downloaded share one request
+        with self.lock:
+            future = self.pending.get(url)
+            if future is not None:
+                return future
+            future = self.pending[url] = self.executor.submit(self.fetch, url)
+        # registered outside the lock, the callback runs right away if the future is done
+        future.add_done_callback(lambda done: self._forget(url, done))
+        return future
+
+    def _forget(self, url, future):
+        with self.lock:
+            if self.pending.get(url) is future:
+                del self.pending[url]
+
+    def submit(self, urls):
+        # start fetching every url, returns url -> future
+        return {url: self._future(url) for url in dict.fromkeys(urls)}
+
+    def fetch_all(self, urls):
+        """Fetch a list of articles concurrently.
+
+        Returns:
+            dict: url -> (title, content).
+        """
+        return {url: future.result() for url, future in self.submit(urls).items()}
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
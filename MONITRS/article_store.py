@@ -0,0 +1,111 @@
+# compressed on-disk store of downloaded articles, keyed by url
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from os.path import join, isdir, isfile
+
+
+def url_key(url):
+    return hashlib.sha256(url.strip().encode('utf-8')).hexdigest()
+
+
+class ArticleStore:
+    """Content-addressed store of article html and extracted text.
+
+    Each article is written once as a zlib-compressed JSON blob under
+    ``root/<key[:2]>/<key>``, where the key is the sha256 of the url. A SQLite
+    index tracks blob sizes and last access times, and the least recently used
+    articles are evicted once the store grows past ``max_bytes``.
+
+    Args:
+        root (str): Directory holding the blobs and the index.
+        max_bytes (int): Size bound of the compressed blobs on disk.
+    """
+
+    def __init__(self, root='article_cache', max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        if not isdir(root):
+            os.makedirs(root)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(join(root, 'index.sqlite'), check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS articles (key TEXT PRIMARY KEY, url TEXT, size INTEGER, last_access REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS articles_last_access ON articles (last_access)")
+        self.conn.commit()
+        # running size of the blobs, so a put does not sum the whole index
+        self.total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM articles").fetchone()[0]
+
+    def _path(self, key):
+        return join(self.root, key[:2], key)
+
+    def get(self, url):
+        """Return the stored article for ``url``.
+
+        Returns:
+            dict: with keys url, html, title and content, or None if it is not stored.
+        """
+        key = url_key(url)
+        path = self._path(key)
+        with self.lock:
+            found = self.conn.execute("UPDATE articles SET last_access = ? WHERE key = ?", (time.time(), key)).rowcount
+            self.conn.commit()
+        if not found:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+        except FileNotFoundError:
+            # evicted by another thread since the lookup
+            return None
+        return json.loads(zlib.decompress(blob))
+
+    def put(self, url, html, title, content):
+        key = url_key(url)
+        path = self._path(key)
+        blob = zlib.compress(json.dumps({'url': url, 'html': html, 'title': title, 'content': content}).encode('utf-8'))
+        if not isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so readers never see a partial blob
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM articles WHERE key = ?", (key,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?)", (key, url, len(blob), time.time()))
+            self.conn.commit()
+            self.total += len(blob) - (row[0] if row else 0)
+        self.evict()
+
+    def __contains__(self, url):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM articles WHERE key = ?", (url_key(url),)).fetchone() is not None
+
+    def urls(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT url FROM articles")]
+
+    def evict(self):
+        # drop least recently used articles until the store fits in max_bytes
+        with self.lock:
+            if self.total <= self.max_bytes:
+                return
+            evicted = []
+            for key, size in self.conn.execute("SELECT key, size FROM articles ORDER BY last_access"):
+                if self.total <= self.max_bytes:
+                    break
+                evicted.append(key)
+                self.total -= size
+            self.conn.executemany("DELETE FROM articles WHERE key = ?", [(key,) for key in evicted])
+            self.conn.commit()
+        for key in evicted:
+            if isfile(self._path(key)):
+                os.remove(self._path(key))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,78 @@
+# benchmark the html extraction backends on the stored article corpus and check
+# that they produce the same output as the BeautifulSoup implementation
+
+import argparse
+import os
+import time
+
+from article_store import ArticleStore
+from html_extract import EXTRACTORS
+
+
+def load_corpus(store_dir=None, html_dir=None, limit=None):
+    pages = []
+    if html_dir:
+        for name in sorted(os.listdir(html_dir)):
+            if name.endswith('.html') or name.endswith('.htm'):
+                with open(os.path.join(html_dir, name), encoding='utf-8', errors='replace') as f:
+                    pages.append((name, f.read()))
+    else:
+        store = ArticleStore(store_dir)
+        for url in store.urls():
+            article = store.get(url)
+            if article is not None and article['html']:
+                pages.append((url, article['html']))
+        store.close()
+    return pages[:limit] if limit else pages
+
+
+def time_backend(extract, pages, repeat):
+    # best of `repeat` runs over the whole corpus
+    best = float('inf')
+    outputs = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [extract(html) for _, html in pages]
+        best = min(best, time.perf_counter() - start)
+    return best, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark html extraction backends")
+    parser.add_argument("--store", type=str, default="article_cache", help="Article store to read pages from")
+    parser.add_argument("--html_dir", type=str, default=None, help="Directory of .html files to use instead of the store")
+    parser.add_argument("--backends", type=str, nargs='+', default=list(EXTRACTORS), help="Backends to compare")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of pages")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per backend")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.store, args.html_dir, args.limit)
+    if not pages:
+        print("No pages found")
+        return
+    total_mb = sum(len(html) for _, html in pages) / 1e6
+    print(f"{len(pages)} pages, {total_mb:.1f} MB of html")
+
+    reference_time, reference = time_backend(EXTRACTORS['bs4'], pages, args.repeat)
+    print(f"{'bs4':>8}: {reference_time:8.3f}s  {total_mb / reference_time:7.2f} MB/s  (reference)")
+
+    for name in args.backends:
+        if name == 'bs4':
+            continue
+        try:
+            elapsed, outputs = time_backend(EXTRACTORS[name], pages, args.repeat)
+        except ImportError as e:
+            print(f"{name:>8}: skipped ({e})")
+            continue
+        mismatches = [page for page, out, ref in zip(pages, outputs, reference) if out != ref]
+        # pages that only differ in whitespace, e.g. where parsers recover broken markup differently
+        loose = [page for page, out, ref in zip(pages, outputs, reference)
+                 if ' '.join(str(out[1]).split()) != ' '.join(str(ref[1]).split())]
+        print(f"{name:>8}: {elapsed:8.3f}s  {total_mb / elapsed:7.2f} MB/s  {reference_time / elapsed:5.1f}x  "
+              f"{len(pages) - len(mismatches)}/{len(pages)} identical, {len(loose)} differ beyond whitespace")
+        for page, _ in loose[:5]:
+            print(f"          differs: {page}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmark find_coverage_center against the original pairwise search in get_image_center
+
+import argparse
+import time
+
+import numpy as np
+
+from image_center import find_coverage_center
+
+
+def pairwise_center(lats, lons, fema_center):
+    # the original O(n^3) search from get_image_center
+    best_count = 0
+    best_center = (None, None)
+    for lat in lats:
+        for lon in lons:
+            count = sum(1 for loc_lat, loc_lon in zip(lats, lons)
+                        if abs(loc_lat - lat) <= 0.05 and abs(loc_lon - lon) <= 0.05)
+            fema_in_square = (lat - 0.05 <= fema_center[0] <= lat + 0.05) and (lon - 0.05 <= fema_center[1] <= lon + 0.05)
+            if count > best_count and fema_in_square:
+                best_count = count
+                best_center = (lat, lon)
+    return best_center
+
+
+def random_event(n, rng, spread=0.3):
+    # clustered points around a fema center, snapped to 4 decimals like geocoder output
+    fema_center = (rng.uniform(25, 48), rng.uniform(-124, -67))
+    lats = list(np.round(fema_center[0] + rng.normal(0, spread, n), 4))
+    lons = list(np.round(fema_center[1] + rng.normal(0, spread, n), 4))
+    lats.append(fema_center[0])
+    lons.append(fema_center[1])
+    return lats, lons, fema_center
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image center search")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10, 50, 100, 200, 500, 1000, 2000, 5000])
+    parser.add_argument("--max_pairwise", type=int, default=200, help="Largest size to run the original search on")
+    parser.add_argument("--trials", type=int, default=20, help="Random events checked for agreement per size")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'points':>7} {'pairwise':>10} {'vectorized':>11} {'agree':>6}")
+    for n in args.sizes:
+        events = [random_event(n, rng) for _ in range(args.trials if n <= args.max_pairwise else 3)]
+
+        start = time.perf_counter()
+        fast = [find_coverage_center(lats, lons, fema) for lats, lons, fema in events]
+        fast_time = (time.perf_counter() - start) / len(events)
+
+        if n <= args.max_pairwise:
+            start = time.perf_counter()
+            slow = [pairwise_center(lats, lons, fema) for lats, lons, fema in events]
+            slow_time = (time.perf_counter() - start) / len(events)
+            agree = sum(a == b for a, b in zip(fast, slow))
+            print(f"{n:>7} {slow_time:>9.4f}s {fast_time:>10.4f}s {agree:>3}/{len(events)}")
+        else:
+            print(f"{n:>7} {'-':>10} {fast_time:>10.4f}s {'-':>6}")
+
+
+if __name__ == "__main__":
+    main()
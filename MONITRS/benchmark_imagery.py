@@ -0,0 +1,75 @@
+# benchmark the imagery download of get_images against the local fake provider
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from downloader import ThumbnailDownloader
+from ee_executor import EERequestExecutor
+from event_images import get_images_batch
+from fake_imagery import FakeImageryProvider
+from tile_cache import TileCache
+
+
+def random_jobs(n, rng, spread=0.5):
+    # events clustered in one area, so that neighbouring events can share tiles
+    jobs = []
+    for index in range(n):
+        center = (30 + rng.uniform(0, spread), -97 + rng.uniform(0, spread))
+        start = datetime.date(2022, 1, 1) + datetime.timedelta(days=int(rng.integers(0, 365)))
+        end = start + datetime.timedelta(days=int(rng.integers(1, 30)))
+        jobs.append((center, start.isoformat(), end.isoformat(), 'Flood', index))
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark get_images against a local fake imagery provider")
+    parser.add_argument("--events", type=int, default=40)
+    parser.add_argument("--spread", type=float, default=0.5, help="Side in degrees of the area the events are drawn from")
+    parser.add_argument("--event_workers", type=int, default=4, help="Events processed at once")
+    parser.add_argument("--download_workers", type=int, default=16, help="Threads of the thumbnail downloader")
+    parser.add_argument("--max_in_flight", type=int, default=16, help="Requests in flight across all events")
+    parser.add_argument("--metadata_latency", type=float, default=0.5)
+    parser.add_argument("--url_latency", type=float, default=0.2)
+    parser.add_argument("--download_latency", type=float, default=0.3)
+    parser.add_argument("--image_dir", type=str, default=None, help="Serve the jpg files of this folder instead of synthetic images")
+    parser.add_argument("--single_request", action="store_true", help="Download rgb and QA60 in one request")
+    parser.add_argument("--tile_cache", action="store_true", help="Share tiles between neighbouring events")
+    args = parser.parse_args()
+
+    jobs = random_jobs(args.events, np.random.default_rng(0), args.spread)
+    image_dir = os.path.abspath(args.image_dir) if args.image_dir else None
+    provider = FakeImageryProvider(metadata_latency=args.metadata_latency, url_latency=args.url_latency,
+                                   download_latency=args.download_latency, image_dir=image_dir)
+    executor = EERequestExecutor(args.max_in_flight)
+    downloader = ThumbnailDownloader(workers=args.download_workers, executor=executor)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # get_images writes to viz_images in the working directory
+        os.chdir(tmp)
+        tile_cache = TileCache('tile_cache') if args.tile_cache else None
+        try:
+            start = time.perf_counter()
+            results = list(get_images_batch(jobs, args.event_workers, downloader=downloader, executor=executor,
+                                            provider=provider, single_request=args.single_request, tile_cache=tile_cache))
+            elapsed = time.perf_counter() - start
+            images = sum(1 for _, _, files in os.walk('viz_images') for f in files if '_cloud_' not in f)
+        finally:
+            if tile_cache is not None:
+                tile_cache.close()
+            os.chdir(cwd)
+    downloader.close()
+    provider.close()
+
+    failed = sum(1 for _, dates in results if dates is None)
+    print(f"{len(jobs)} events ({failed} failed), {images} images in {elapsed:.1f}s: "
+          f"{len(jobs) / elapsed:.2f} events/s, {images / elapsed:.2f} images/s")
+    executor.report()
+
+
+if __name__ == "__main__":
+    main()
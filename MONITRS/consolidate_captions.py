@@ -5,6 +5,13 @@ import datetime
 from collections import defaultdict
 from typing import List, Dict, Tuple, Optional
 
+from records import read_records, write_records
+
+NO_EVENT_INDICATORS = [
+    "No events", "No significant updates", "No specific event",
+    "Information on", "not provided", "No event from the provided article"
+]
+
 def parse_data(csv_content: str) -> List[Dict]:
     """
     Parse the data from CSV content.
@@ -66,17 +73,12 @@ def extract_dated_statements(statements_text: str, filter_no_events: bool = True
     # Use regex to extract date-statement pairs
     date_pattern = re.compile(r'(\d{4}-\d{2}-\d{2}):\s*(.*?)(?=\s*\d{4}-\d{2}-\d{2}:|$)')
     
-    no_event_indicators = [
-        "No events", "No significant updates", "No specific event", 
-        "Information on", "not provided", "No event from the provided article"
-    ]
-    
     for match in date_pattern.finditer(statements_text):
         date = match.group(1)
         statement = match.group(2).strip()
         
         # Determine if statement is non-informative
-        is_no_event = any(phrase in statement for phrase in no_event_indicators)
+        is_no_event = any(phrase in statement for phrase in NO_EVENT_INDICATORS)
         
         # Add statement if it's informative or if we're not filtering
         if not filter_no_events or not is_no_event:
@@ -198,6 +200,48 @@ def consolidate_statements(statements: List[Dict], image_dates: List[str]) -> Li
     
     return consolidated
 
+def consolidate_row(row_id: str, all_statements: List[Dict], image_dates: List[str]) -> Optional[List[Dict]]:
+    """
+    Consolidate the statements of one row, or skip the row.
+    
+    Args:
+        row_id: Id of the row, for the messages
+        all_statements: Dated statements of the row, with their is_no_event flag
+        image_dates: Dates of the images of the row
+        
+    Returns:
+        Consolidated statements as returned by consolidate_statements, or None if the row is skipped
+    """
+    # Check if ALL statements are non-informative (No event...)
+    all_no_event = all(statement.get('is_no_event', False) for statement in all_statements)
+    
+    # If all statements are "No event...", skip this row entirely
+    if all_no_event:
+        print(f"Skipping row {row_id} as all statements are 'No event...'")
+        return None
+    
+    # Filter to get only the informative statements for consolidation
+    informative_statements = [
+        statement for statement in all_statements 
+        if not statement.get('is_no_event', False)
+    ]
+    
+    if not image_dates:
+        # print(f"Warning: No image dates found for row {row_id}. Skipping consolidation.")
+        return None
+
+    # if more than 8 image dates, skip
+    if len(image_dates) > 8:
+        # print(f"Warning: More than 8 image dates found for row {row_id}. Skipping consolidation.")
+        return None
+    
+    # Skip if no informative statements after filtering
+    if not informative_statements:
+        print(f"Skipping row {row_id} as no informative statements remain after filtering")
+        return None
+    
+    return consolidate_statements(informative_statements, image_dates)
+
 def reorganize_data(csv_content: str, image_folder: str) -> List[Dict]:
     """
     Reorganize wildfire data by consolidating statements based on available image dates.
@@ -231,42 +275,9 @@ def reorganize_data(csv_content: str, image_folder: str) -> List[Dict]:
         
         # Extract all statements (including non-informative ones)
         all_statements = extract_dated_statements(row['statements'], filter_no_events=False)
-        
-        # Check if ALL statements are non-informative (No event...)
-        all_no_event = all(statement.get('is_no_event', False) for statement in all_statements)
-        
-        # If all statements are "No event...", skip this row entirely
-        if all_no_event:
-            print(f"Skipping row {row_id} as all statements are 'No event...'")
+        consolidated = consolidate_row(row_id, all_statements, image_dates_by_row.get(row_id, []))
+        if consolidated is None:
             continue
-        
-        # Filter to get only the informative statements for consolidation
-        informative_statements = [
-            statement for statement in all_statements 
-            if not statement.get('is_no_event', False)
-        ]
-        
-        # Get image dates for this row if available
-        image_dates = image_dates_by_row.get(row_id, [])
-        
-        if not image_dates:
-            # print(f"Warning: No image dates found for row {row_id}. Skipping consolidation.")
-            continue
-
-        # if more than 8 image dates, skip
-        if len(image_dates) > 8:
-            # print(f"Warning: More than 8 image dates found for row {row_id}. Skipping consolidation.")
-            continue
-        
-        # Skip if no informative statements after filtering
-        if not informative_statements:
-            print(f"Skipping row {row_id} as no informative statements remain after filtering")
-            continue
-        
-        # We pass both the informative statements and all statements to the consolidation function
-        # This allows us to check if there are dates with only "no event" statements
-        consolidated = consolidate_statements(informative_statements, image_dates)
-        # print(f"Consolidated data for row {row_id}: {consolidated}")
 
         new_statements = '['
         # reformat to match date: consolidated statements
@@ -290,6 +301,31 @@ def reorganize_data(csv_content: str, image_folder: str) -> List[Dict]:
     
     return result
 
+def reorganize_records(records: List[Dict], image_dates_by_row: Dict[str, List[str]]) -> List[Dict]:
+    """
+    Same as reorganize_data, for the records written by get_article_aggregate_locations.py.
+    
+    Args:
+        records: Event records, see records.py
+        image_dates_by_row: Dictionary mapping row indices to lists of image dates
+        
+    Returns:
+        Records whose statements are the consolidated statements, one per image date
+    """
+    result = []
+    for record in records:
+        row_id = str(record['id'])
+        # the statements are already split by date, only the no event check is left
+        all_statements = [dict(statement, is_no_event=any(phrase in statement['statement'] for phrase in NO_EVENT_INDICATORS))
+                          for statement in record['statements']]
+        consolidated = consolidate_row(row_id, all_statements, image_dates_by_row.get(row_id, []))
+        if consolidated is None:
+            continue
+        statements = [{'date': entry['image_date'], 'statement': entry['consolidated_statements']} for entry in consolidated]
+        result.append(dict(record, statements=statements,
+                           statements_text=' '.join(f"{s['date']}: {s['statement']}" for s in statements)))
+    return result
+
 def save_reorganized_data(reorganized_data: List[Dict], output_file: str):
     """
     Save the reorganized data to a file.
@@ -332,9 +368,20 @@ def main():
     Main function to process the data.
     """
     # File paths
+    records_file = 'new_viz.jsonl'  # Written by get_article_aggregate_locations.py, .parquet also works
     csv_file = 'parsed_image_text.csv'  # Replace with your actual file
     image_folder = '.'  # Base folder containing all_events
     output_file = 'reorganized_total_data.csv'
+    records_output_file = 'reorganized_total_data.jsonl'
+    
+    if os.path.exists(records_file):
+        # structured records need no regex parsing
+        records = read_records(records_file)
+        print(f"Successfully read {len(records)} records from {records_file}")
+        reorganized_records = reorganize_records(records, get_image_dates_by_row(image_folder))
+        write_records(reorganized_records, records_output_file)
+        print(f"\nReorganized data saved to {records_output_file}")
+        return
     
     # For testing purposes, using the provided data
     sample_data = """0,"https://wildfiretoday.com/2022/07/20/firefighters-work-to-control-two-fires-in-north-texas-chalk-mountain-and-1148/,(32.7615226, -97.7980825),{"" 'FM51'"": (32.7615226, -97.7980825), "" 'Palo Pinto County'"": (32.7215726, -98.2814881), "" 'Rock Church Highway'"": (32.345025, -97.948555), "" 'Texas'"": (31.2638905, -98.5456116)},[2022-07-13: No events described in the article are visible from this date. 2022-07-18: The 1148 Fire near Possum Kingdom Lake started on Monday (July 17th), and by this date, 50 homes had been evacuated and at least two homes were visibly gutted. 2022-07-18: The Chalk Mountain Fire began on Monday (July 17th), and by this date a mandatory evacuation order for certain areas had been issued and later rescinded. 2022-07-23: No events described in the article are visible from this date. 2022-07-23: No events described in the article are visible from this date. 2022-07-28: No events described in the article are visible from this date. 2022-07-28: No events described in the article are visible from this date. 2022-08-02: No events described in the article are visible from this date. 2022-08-02: No events described in the article are visible from this date. 2022-08-07: No events described in the article are visible from this date. 2022-08-07: No events described in the article are visible from this date. 2022-08-12: No events described in the article are visible from this date. 2022-08-12: No events described in the article are visible from this date. 2022-08-17: No events described in the article are visible from this date. 2022-08-17: No events described in the article are visible from this date. 2022-08-22: No events described in the article are visible from this date. 2022-08-22: No events described in the article are visible from this date.  ]"
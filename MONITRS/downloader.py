@@ -0,0 +1,100 @@
+# bounded thread pool for downloading earth engine thumbnails
+
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.dummy import Pool
+from urllib.parse import urlparse
+
+import requests
+
+from article_fetcher import make_session
+
+# responses worth retrying, everything else in the 4xx range is a permanent failure
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# errors worth retrying. other exceptions, e.g. an EEException from getThumbURL for a
+# missing band, fail the same way every time (the earth engine client already retries
+# its own 429 responses)
+RETRY_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError)
+
+
+class ThumbnailDownloader:
+    """Download thumbnails concurrently with retries and per-host limits.
+
+    Each job is a (key, get_url) pair. ``get_url`` is called inside the pool, since
+    generating an Earth Engine thumbnail url (``getThumbURL``) is itself a blocking
+    request. A job that failed with a transient error (connection errors, timeouts,
+    429 and 5xx responses) is retried with exponential backoff, whether the url
+    generation or the download failed. Other errors skip the job right away.
+
+    Args:
+        workers (int): Number of download threads.
+        per_host (int): Maximum concurrent downloads from a single host.
+        retries (int): Number of retries after the first attempt.
+        backoff (float): Delay before the first retry in seconds, doubled on each retry.
+        timeout (float): Timeout of each download in seconds.
+        executor (EERequestExecutor): Optional executor the url generation and the
+            downloads go through, to share its in-flight limit and latency stats.
+    """
+
+    def __init__(self, workers=16, per_host=16, retries=3, backoff=2, timeout=60, executor=None):
+        self.executor = executor
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = make_session(workers)
+        self.pool = Pool(workers)
+        self.host_limits = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+        self.lock = threading.Lock()
+
+    def _host_limit(self, url):
+        with self.lock:
+            return self.host_limits[urlparse(url).netloc]
+
+    def _call(self, label, fn, *args, **kwargs):
+        if self.executor is None:
+            return fn(*args, **kwargs)
+        return self.executor.call(label, fn, *args, **kwargs)
+
+    def fetch(self, get_url):
+        """Generate the url and download it.
+
+        Returns:
+            bytes: Response body, or None if every attempt failed.
+        """
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                url = self._call('url', get_url)
+                with self._host_limit(url):
+                    response = self._call('download', self.session.get, url, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.content
+                error = f"HTTP {response.status_code}"
+            except RETRY_ERRORS as e:
+                error = e
+            except Exception as e:
+                print(f"Download failed: {e}")
+                return None
+        print(f"Download failed after {self.retries + 1} attempts: {error}")
+        return None
+
+    def download(self, jobs):
+        """Run the jobs on the pool.
+
+        Args:
+            jobs (list): (key, get_url) pairs.
+
+        Yields:
+            tuple: (key, bytes or None) in completion order.
+        """
+        yield from self.pool.imap_unordered(lambda job: (job[0], self.fetch(job[1])), jobs)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.session.close()
@@ -0,0 +1,69 @@
+# shared limit and latency accounting for earth engine requests made from many threads
+
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+class EERequestExecutor:
+    """Run Earth Engine requests from any number of threads, a bounded number at a time.
+
+    Earth Engine enforces a per-project limit on concurrent requests, so every
+    metadata query (``getInfo``), url generation (``getThumbURL``) and pixel download
+    of all events goes through a single semaphore. The latency of each call is
+    recorded under a label to show where the time goes.
+
+    Args:
+        max_in_flight (int): Maximum number of requests running at once.
+    """
+
+    def __init__(self, max_in_flight=16):
+        self.max_in_flight = max_in_flight
+        self.limit = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, label, fn, *args, **kwargs):
+        """Call ``fn(*args, **kwargs)`` once a request slot is free.
+
+        Args:
+            label (str): Name the latency is recorded under, e.g. 'scenes' or 'download'.
+            fn (callable): Blocking function making the request.
+
+        Returns:
+            The result of ``fn``, exceptions are re-raised after being counted.
+        """
+        with self.limit:
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                with self.lock:
+                    self.errors[label] += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.latencies[label].append(elapsed)
+
+    def stats(self):
+        """Summarize the recorded latencies.
+
+        Returns:
+            dict: label -> dict with count, errors, mean, p50, p95 and max in seconds.
+        """
+        with self.lock:
+            latencies = {label: np.array(values) for label, values in self.latencies.items()}
+            errors = dict(self.errors)
+        return {label: {'count': len(values), 'errors': errors.get(label, 0), 'mean': float(values.mean()),
+                        'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)),
+                        'max': float(values.max())}
+                for label, values in latencies.items()}
+
+    def report(self):
+        for label, s in sorted(self.stats().items()):
+            print(f"{label}: {s['count']} requests, {s['errors']} errors, mean {s['mean']:.2f}s, "
+                  f"p50 {s['p50']:.2f}s, p95 {s['p95']:.2f}s, max {s['max']:.2f}s")
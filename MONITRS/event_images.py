@@ -0,0 +1,332 @@
+# download of the sentinel-2 images of an event from an imagery provider
+
+import datetime
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from os.path import join, isfile
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from PIL import Image
+from tqdm import tqdm
+
+from downloader import ThumbnailDownloader
+from filter_invalid_images import is_valid_array
+from imagery import EarthEngineProvider, decode_rgb_qa, group_by_day, sample_scenes
+
+_default_provider = None
+
+
+def default_provider():
+    # earth engine is only initialized when get_images is first called without a provider
+    global _default_provider
+    if _default_provider is None:
+        _default_provider = EarthEngineProvider()
+    return _default_provider
+
+
+def decode_image(data):
+    # decode downloaded image bytes, None if the download failed or is not an image
+    if data is None:
+        return None
+    try:
+        return np.array(Image.open(io.BytesIO(data)))
+    except Exception as e:
+        return None
+
+def is_dark(img_array):
+    return img_array is not None and np.mean(img_array) < 30
+
+def get_images(center, starttime, endtime, incident_type, index, downloader=None, single_request=False,
+               cloud_method='metadata', max_cloud=None, mosaic=True, max_scenes=8, sampling='even',
+               tile_cache=None, executor=None, provider=None):
+    halfwidth=0.05
+    odir='viz_images'
+    buffer_days = 5
+
+    if provider is None:
+        provider = default_provider()
+
+    min_lon = center[1] - halfwidth
+    max_lon = center[1] + halfwidth
+    min_lat = center[0] - halfwidth
+    max_lat = center[0] + halfwidth
+
+
+    # several events can run concurrently, see get_images_batch
+    outdir = join(odir, str(index))
+    os.makedirs(outdir, exist_ok=True)
+
+    # bounds is center +- halfwidth
+    box = (min_lon, min_lat, max_lon, max_lat)
+
+    # starttime and endtime are strings
+    start_date_str = starttime
+    start_date_buffer_str = (datetime.datetime.strptime(starttime, '%Y-%m-%d') - relativedelta(days=buffer_days)).strftime('%Y-%m-%d')
+
+    end_date_str = endtime
+    # if endtime has 00:00:00, remove it
+    if len(endtime) > 10:
+        endtime = endtime[:10]
+    end_date_buffer_str = (datetime.datetime.strptime(endtime, '%Y-%m-%d') + relativedelta(days=buffer_days)).strftime('%Y-%m-%d')
+
+    # the per-scene cloud fraction is only computed when it is used, the tile metadata
+    # is enough to list the scenes otherwise
+    if max_cloud is None and sampling != 'least_cloudy':
+        cloud_method = 'metadata'
+
+    # the SR_HARMONIZED -> HARMONIZED -> S2 fallback, the optional cloud prefilter and
+    # the image ids and dates of the chosen collection are resolved in a single request
+    try:
+        query = partial(provider.find_scenes, box, start_date_buffer_str, end_date_buffer_str,
+                        cloud_method=cloud_method, max_cloud=max_cloud)
+        collection_id, scenes, counts = executor.call('scenes', query) if executor else query()
+        print("num_images", counts)
+    except Exception as e:
+        print("Error getting number of images:", e)
+        return
+
+    # if there are no images in any collection, return
+    if not scenes:
+        print("No images found for event in S2, all tried", index)
+        return []
+
+    # one image per day, a server-side mosaic of all tiles acquired that day (or the
+    # first tile), and at most max_scenes days, since events with more dates are
+    # dropped by consolidate_captions.py anyway
+    days = sample_scenes(group_by_day(scenes), max_scenes, sampling)
+    dates_list = [img_date for img_date, _, _ in days]
+
+    images = {}
+    for img_date, ids, _ in days:
+        output_file = join(outdir, f'{index}_{img_date}.jpg')
+        if not isfile(output_file):
+            images[img_date] = ids
+
+    own_downloader = downloader is None
+    if own_downloader:
+        downloader = ThumbnailDownloader(executor=executor)
+
+    if tile_cache is not None:
+        failed = get_tile_images(days, collection_id, box, index, outdir, tile_cache, downloader, provider, single_request, mosaic)
+        if own_downloader:
+            downloader.close()
+        if failed:
+            print(f"Failed to download {len(failed)} images for event {index}")
+            return
+        print(f"Downloaded images for event {index} ({incident_type})")
+        return dates_list
+
+    # download all images in parallel, they are checked in memory and only
+    # written to disk if they pass the same checks as filter_invalid_images.py
+    if single_request:
+        # rgb bands and QA60 in one request, the cloud mask is derived locally
+        jobs = [(img_date, partial(provider.download_url, collection_id, img_date, ids, box, mosaic=mosaic))
+                for img_date, ids in images.items()]
+        decode = decode_rgb_qa
+    else:
+        jobs = [(img_date, partial(provider.thumbnail_url, collection_id, img_date, ids, box, mosaic=mosaic))
+                for img_date, ids in images.items()]
+        decode = lambda data: (decode_image(data), None)
+    downloaded = dict(tqdm(downloader.download(jobs), total=len(jobs)))
+    decoded = {img_date: decode(data) for img_date, data in downloaded.items()}
+
+    # if image is more than 30% black, redo the download
+    dark_jobs = [(img_date, get_url) for img_date, get_url in jobs if is_dark(decoded[img_date][0])]
+    for img_date, data in downloader.download(dark_jobs):
+        if data is not None:
+            downloaded[img_date] = data
+            decoded[img_date] = decode(data)
+
+    # dates whose download failed, unlike the images rejected by the checks below
+    # they are retried by the next run
+    failed = []
+    cloud_jobs = []
+    for img_date, (img_array, cloud_mask) in decoded.items():
+        if img_array is None:
+            print("error with image", img_date)
+            failed.append(img_date)
+            continue
+        # if images is all white or otherwise invalid, it is never written
+        if np.mean(img_array) > 200 or not is_valid_array(img_array):
+            continue
+        output_file = join(outdir, f'{index}_{img_date}.jpg')
+        if single_request:
+            Image.fromarray(img_array).save(output_file, quality=95)
+            # the binary mask is stored losslessly
+            Image.fromarray(cloud_mask).save(join(outdir, f'{index}_cloud_{img_date}.png'))
+            continue
+        with open(output_file, 'wb') as out:
+            out.write(downloaded[img_date])
+
+        # download the cloud mask image
+        cloud_jobs.append((img_date, partial(provider.thumbnail_url, collection_id, img_date, images[img_date], box, cloud=True, mosaic=mosaic)))
+
+    # cloud masks for the accepted images, also in parallel
+    for img_date, data in downloader.download(cloud_jobs):
+        cloud_output_file = join(outdir, f'{index}_cloud_{img_date}.jpg')
+        img_array = decode_image(data)
+        if img_array is None:
+            print("error with cloud image", img_date)
+            # the image is removed too, so the next run downloads both again
+            os.remove(join(outdir, f'{index}_{img_date}.jpg'))
+            failed.append(img_date)
+            continue
+        # keep only the probability band
+        img_array = img_array[:,:,0]
+        # make any non black pixel white
+        img_array[img_array != 0] = 255
+        # save the image
+        Image.fromarray(img_array).save(cloud_output_file)
+
+    if own_downloader:
+        downloader.close()
+
+    if failed:
+        print(f"Failed to download {len(failed)} images for event {index}")
+        return
+    print(f"Downloaded images for event {index} ({incident_type})")
+    return dates_list
+
+
+def get_images_batch(jobs, workers=4, **kwargs):
+    """Run get_images for many events concurrently.
+
+    Pass a shared ``downloader``, ``executor`` and ``provider`` in ``kwargs`` so the
+    requests of all events share one pool and one in-flight limit.
+
+    Args:
+        jobs (list): (center, starttime, endtime, incident_type, index) tuples.
+        workers (int): Number of events processed at once.
+        **kwargs: Keyword arguments of get_images.
+
+    Yields:
+        tuple: (index, dates list or None) in completion order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(get_images, *job, **kwargs): job[4] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                print(f"Error getting images for event {futures[future]}: {e}")
+                yield futures[future], None
+
+
+def tile_source(collection_id, ids, mosaic=True):
+    # tiles are only shared by events that selected the same scenes of a day
+    return f"{collection_id}/{'+'.join(sorted(ids) if mosaic else ids[:1])}"
+
+
+def get_tile_images(days, collection_id, box, index, outdir, tile_cache, downloader, provider, single_request=False, mosaic=True):
+    """Write the images of an event as crops of tiles shared with neighbouring events.
+
+    Tiles missing from ``tile_cache`` are downloaded once over the whole tile, from
+    the scenes of that day selected for the event, together with their cloud mask,
+    and stored for the events that follow. Tiles are cached per set of scenes, so
+    an event whose cloud filter kept different scenes does not reuse them.
+
+    Args:
+        days (list): (date, scene ids, cloud fraction) tuples to write.
+        collection_id (str): Collection the scenes come from.
+        box (tuple): (min_lon, min_lat, max_lon, max_lat) of the event.
+        index (int): Event index, used in the file names.
+        outdir (str): Directory of the event images.
+        tile_cache (TileCache): Cache the tiles are read from and written to.
+        downloader (ThumbnailDownloader): Downloader used for missing tiles.
+        provider (ImageryProvider): Backend the missing tiles are downloaded from.
+        single_request (bool): Download rgb and QA60 in one request per tile.
+        mosaic (bool): Mosaic the scenes of a day, otherwise use the first one.
+
+    Returns:
+        list: Dates whose tile or cloud mask could not be downloaded.
+    """
+    tile = tile_cache.tile_bounds(box)
+    dimensions = f'{tile_cache.pixels}x{tile_cache.pixels}'
+    ids_by_date = {img_date: ids for img_date, ids, _ in days}
+    sources = {img_date: tile_source(collection_id, ids, mosaic) for img_date, ids in ids_by_date.items()}
+
+    if single_request:
+        decode = decode_rgb_qa
+    else:
+        decode = lambda data: (decode_image(data), None)
+    tiles = {}
+    claimed = []
+    jobs = []
+    missing = []
+    # claims are made inside the try, so they are released even if reading a cached tile fails
+    try:
+        for img_date, ids, _ in days:
+            if isfile(join(outdir, f'{index}_{img_date}.jpg')):
+                continue
+            missing.append(img_date)
+            cached = tile_cache.get(sources[img_date], img_date, 'rgb', box)
+            if cached is not None and tile_cache.get(sources[img_date], img_date, 'cloud', box) is None:
+                # a tile whose cloud mask failed to download is downloaded again
+                cached = None
+            if cached is None and tile_cache.claim(sources[img_date], img_date, tile):
+                claimed.append(img_date)
+                if single_request:
+                    jobs.append((img_date, partial(provider.download_url, collection_id, img_date, ids, tile, dimensions, crs='EPSG:4326', mosaic=mosaic)))
+                else:
+                    jobs.append((img_date, partial(provider.thumbnail_url, collection_id, img_date, ids, tile, dimensions, crs='EPSG:4326', mosaic=mosaic)))
+                continue
+            if cached is None:
+                # another event was downloading the same tile
+                cached = tile_cache.get(sources[img_date], img_date, 'rgb', box)
+            if cached is not None:
+                tiles[img_date] = cached
+
+        decoded = {img_date: decode(data) for img_date, data in downloader.download(jobs)}
+        # if image is more than 30% black, redo the download
+        dark_jobs = [(img_date, get_url) for img_date, get_url in jobs if is_dark(decoded[img_date][0])]
+        for img_date, data in downloader.download(dark_jobs):
+            if data is not None:
+                decoded[img_date] = decode(data)
+
+        cloud_jobs = []
+        for img_date, (img_array, cloud_mask) in decoded.items():
+            if img_array is None:
+                print("error with image", img_date)
+                continue
+            tile_cache.put(sources[img_date], img_date, 'rgb', tile, img_array)
+            tiles[img_date] = (img_array, tile)
+            if cloud_mask is not None:
+                tile_cache.put(sources[img_date], img_date, 'cloud', tile, cloud_mask)
+                continue
+            cloud_jobs.append((img_date, partial(provider.thumbnail_url, collection_id, img_date, ids_by_date[img_date], tile, dimensions,
+                                                 crs='EPSG:4326', cloud=True, mosaic=mosaic)))
+
+        for img_date, data in downloader.download(cloud_jobs):
+            img_array = decode_image(data)
+            if img_array is None:
+                print("error with cloud image", img_date)
+                continue
+            # keep only the probability band and make any non black pixel white
+            img_array = img_array[:,:,0]
+            img_array[img_array != 0] = 255
+            tile_cache.put(sources[img_date], img_date, 'cloud', tile, img_array)
+    finally:
+        for img_date in claimed:
+            tile_cache.release(sources[img_date], img_date, tile)
+
+    # dates without a downloaded tile, or whose cloud mask is missing, are retried by the next run
+    failed = [img_date for img_date in missing if img_date not in tiles]
+    for img_date, (tile_array, bounds) in tiles.items():
+        img_array = tile_cache.crop(tile_array, bounds, box)
+        # if images is all white or otherwise invalid, it is never written
+        if np.mean(img_array) > 200 or not is_valid_array(img_array):
+            continue
+        cached = tile_cache.get(sources[img_date], img_date, 'cloud', box)
+        if cached is None:
+            print("error with cloud image", img_date)
+            failed.append(img_date)
+            continue
+        Image.fromarray(img_array).save(join(outdir, f'{index}_{img_date}.jpg'), quality=95)
+        cloud_mask = tile_cache.crop(cached[0], cached[1], box, resample=Image.NEAREST)
+        # the single request masks are stored losslessly, as in get_images
+        extension = 'png' if single_request else 'jpg'
+        Image.fromarray(cloud_mask).save(join(outdir, f'{index}_cloud_{img_date}.{extension}'))
+    return failed
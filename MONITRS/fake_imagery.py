@@ -0,0 +1,160 @@
+# local stand-in for earth engine, used to run and benchmark get_images without network access
+
+import datetime
+import hashlib
+import io
+import os
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import numpy as np
+from PIL import Image
+
+from imagery import ImageryProvider
+
+FAKE_COLLECTION = 'FAKE/S2'
+
+
+def _seed(*parts):
+    return int.from_bytes(hashlib.sha1('|'.join(map(str, parts)).encode('utf-8')).digest()[:8], 'little')
+
+
+def _texture(seed, width, height, low, high, channels):
+    # smooth random field, upsampled from a coarse grid so it compresses like imagery
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(low, high, (max(height // 16, 1), max(width // 16, 1), channels), dtype=np.uint8)
+    image = Image.fromarray(coarse.squeeze(-1) if channels == 1 else coarse).resize((width, height), Image.BILINEAR)
+    return np.asarray(image)
+
+
+def _encode(array, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'NPY':
+        np.save(buffer, array)
+    else:
+        Image.fromarray(array).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=256)
+def _render(kind, date, box, width, height, cloud, image_path):
+    seed = _seed(date, box)
+    if image_path is not None:
+        rgb = np.asarray(Image.open(image_path).convert('RGB').resize((width, height)))
+    else:
+        rgb = _texture(seed, width, height, 40, 180, 3)
+    cloudy = _texture(seed + 1, width, height, 0, 255, 1) > 180
+    if kind == 'download':
+        bands = np.zeros((height, width), dtype=[('B4', '<u2'), ('B3', '<u2'), ('B2', '<u2'), ('QA60', '<u2')])
+        for i, band in enumerate(('B4', 'B3', 'B2')):
+            bands[band] = rgb[:, :, i].astype(np.int32) * 3000 // 255
+        bands['QA60'] = np.where(cloudy, 1 << 10, 0)
+        return _encode(bands, 'NPY')
+    if cloud:
+        # like the masked thumbnail, clear pixels keep their value and clouds are black
+        rgb = np.where(cloudy[:, :, None], 0, np.maximum(rgb, 1)).astype(np.uint8)
+    return _encode(rgb, 'JPEG')
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        provider = self.server.provider
+        time.sleep(provider.download_latency)
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        width, height = (int(v) for v in params['dimensions'].split('x'))
+        body = _render(url.path.strip('/'), params['date'], params['box'], width, height,
+                       params.get('cloud') == '1', provider.image_for(params['date'], params['box']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # the default backlog of 5 makes concurrent downloads wait for tcp retransmits
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakeImageryProvider(ImageryProvider):
+    """Synthetic Sentinel-2 scenes served from a local HTTP server.
+
+    Scenes are acquired every ``revisit_days`` days with ``tiles_per_day`` scenes a
+    day, and their cloud fractions are derived from a hash of the box and date, so
+    the same query always returns the same scenes. Thumbnails are seeded random
+    textures, or the jpg files of ``image_dir`` (e.g. an old viz_images folder),
+    served by a ThreadingHTTPServer on localhost. Every kind of request waits for a
+    configurable latency, to measure get_images under Earth Engine round trip times
+    on a machine with no network.
+
+    Args:
+        revisit_days (int): Days between two acquisitions.
+        tiles_per_day (int): Scenes acquired on each acquisition day.
+        metadata_latency (float): Seconds taken by ``find_scenes``.
+        url_latency (float): Seconds taken to generate a url.
+        download_latency (float): Seconds the server waits before answering.
+        image_dir (str): Directory searched for jpg files to serve, synthetic images if None.
+        port (int): Port of the server, any free port if 0.
+    """
+
+    def __init__(self, revisit_days=5, tiles_per_day=2, metadata_latency=0.5, url_latency=0.2, download_latency=0.3,
+                 image_dir=None, port=0):
+        self.revisit_days = revisit_days
+        self.tiles_per_day = tiles_per_day
+        self.metadata_latency = metadata_latency
+        self.url_latency = url_latency
+        self.download_latency = download_latency
+        self.images = []
+        if image_dir is not None:
+            self.images = sorted(join(root, f) for root, _, files in os.walk(image_dir)
+                                 for f in files if f.endswith('.jpg') and '_cloud_' not in f)
+        self.server = _Server(('127.0.0.1', port), _Handler)
+        self.server.provider = self
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def image_for(self, date, box):
+        if not self.images:
+            return None
+        return self.images[_seed(date, box) % len(self.images)]
+
+    def find_scenes(self, box, start, end, cloud_method='metadata', max_cloud=None):
+        time.sleep(self.metadata_latency)
+        first = datetime.date.fromisoformat(start).toordinal()
+        last = datetime.date.fromisoformat(end).toordinal()
+        scenes = []
+        count = 0
+        for day in range(first + (-first) % self.revisit_days, last, self.revisit_days):
+            date = datetime.date.fromordinal(day).isoformat()
+            for tile in range(self.tiles_per_day):
+                count += 1
+                cloud = (_seed(date, tile, np.round(box, 1)) % 1000) / 1000
+                if max_cloud is None or cloud <= max_cloud:
+                    scenes.append((f'{date.replace("-", "")}_T{tile:02d}', date, cloud))
+        return FAKE_COLLECTION, scenes, {FAKE_COLLECTION: count}
+
+    def _url(self, kind, date, box, dimensions, cloud=False):
+        time.sleep(self.url_latency)
+        box = ','.join(f'{v:.4f}' for v in box)
+        return f'{self.url}/{kind}?' + urlencode({'date': date, 'box': box, 'dimensions': dimensions, 'cloud': int(cloud)})
+
+    def thumbnail_url(self, collection_id, date, ids, box, dimensions='512x512', crs=None, cloud=False, mosaic=True):
+        return self._url('thumbnail', date, box, dimensions, cloud)
+
+    def download_url(self, collection_id, date, ids, box, dimensions='512x512', crs=None, mosaic=True):
+        return self._url('download', date, box, dimensions)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
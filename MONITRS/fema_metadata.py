@@ -0,0 +1,51 @@
+# index-keyed access to the FEMA declarations, loaded once per script
+
+import os
+from os.path import isfile
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401, only needed for the parquet cache
+except ImportError:
+    pyarrow = None
+
+# dtypes of the columns read by the pipeline, dates stay strings as the scripts slice them
+FEMA_DTYPES = {'index': 'int64', 'incidentBeginDate': 'string', 'incidentEndDate': 'string',
+               'incidentType': 'string', 'lat': 'float64', 'lon': 'float64'}
+
+
+class FemaMetadata:
+    """FEMA_filtered_processed.csv as a dict of rows keyed by the ``index`` column.
+
+    The csv is parsed once and every lookup is a dict access, instead of a scan of
+    the whole table per event. If pyarrow is installed the parsed table is cached
+    next to the csv as parquet, and reused as long as it is newer than the csv.
+    When an index appears more than once the first row wins, like
+    ``df.loc[...].values[0]``.
+
+    Args:
+        path (str): Path to the FEMA csv.
+        parquet_cache (bool): Read and write the parquet cache when pyarrow is available.
+    """
+
+    def __init__(self, path='FEMA_filtered_processed.csv', parquet_cache=True):
+        self.path = path
+        cache_path = os.path.splitext(path)[0] + '.parquet'
+        use_cache = parquet_cache and pyarrow is not None
+        if use_cache and isfile(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            df = pd.read_parquet(cache_path)
+        else:
+            df = pd.read_csv(path, header=0)
+            df = df.astype({column: dtype for column, dtype in FEMA_DTYPES.items() if column in df.columns})
+            if use_cache:
+                df.to_parquet(cache_path, index=False)
+        self.df = df
+        rows = df.drop_duplicates('index', keep='first').set_index('index', drop=False)
+        # plain python values, so callers get str/float rather than pandas scalars
+        self.rows = {int(index): {k: (None if pd.isna(v) else v) for k, v in row.items()}
+                     for index, row in rows.astype(object).to_dict('index').items()}
+
+    def __getitem__(self, index):
+        """Return the row of a FEMA index as a dict, raises KeyError if it is unknown."""
+        return self.rows[int(index)]
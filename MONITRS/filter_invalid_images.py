@@ -3,10 +3,20 @@
 
 
 import os
-import PIL
 from PIL import Image
 import numpy as np
-import cv2
+
+def is_valid_array(img):
+    # if 75% of the image is white or black, then it is invalid
+    if np.mean(img) < 25 or np.mean(img) > 240:
+        return False
+    # if the colors are only black or white, then it is invalid
+    if np.unique(img).shape[0] < 3:
+        return False
+    # if number of pixels with value 0 is 5% of the total pixels, then it is invalid
+    if np.count_nonzero(img == 0) > (0.05 * (512*512)):
+        return False
+    return True
 
 def is_valid_image(img_path):
     try:
@@ -14,16 +24,7 @@ def is_valid_image(img_path):
         # get img as numpy array
         img = np.array(img)
         # print(img_path,img.shape)
-        # if 75% of the image is white or black, then it is invalid
-        if np.mean(img) < 25 or np.mean(img) > 240:
-            return False
-        # if the colors are only black or white, then it is invalid
-        if np.unique(img).shape[0] < 3:
-            return False
-        # if number of pixels with value 0 is 5% of the total pixels, then it is invalid
-        if np.count_nonzero(img == 0) > (0.05 * (512*512)):
-            return False
-        return True
+        return is_valid_array(img)
     except Exception as e:
         print(f"Error opening image {img_path}: {e}")
         return False
@@ -0,0 +1,285 @@
+# geocoding of the location names extracted from the articles
+
+import argparse
+import io
+import sqlite3
+import threading
+import time
+import zipfile
+
+import requests
+
+from article_fetcher import make_session
+from rate_limit import TokenBucket
+
+
+def normalize_location(name):
+    # the names come from splitting the gemini response, strip quotes and whitespace
+    name = name.strip().strip('"\'').strip()
+    return ' '.join(name.lower().split())
+
+
+class Geocoder:
+    """Interface for geocoding backends."""
+
+    def geocode(self, name):
+        """Look up a location name.
+
+        Args:
+            name (str): Location name.
+
+        Returns:
+            tuple: (lat, lon), or None if the name could not be resolved.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class HTTPGeocoder(Geocoder):
+    """Geocoder backed by the geocode.maps.co search API.
+
+    Requests from all threads share one rate limit. Rate limited (429) requests
+    are retried after the delay the server asks for, or an exponential backoff.
+
+    Args:
+        api_key (str): geocode.maps.co API key.
+        session (requests.Session): Session to reuse, a pooled one is created if None.
+        timeout (float): Request timeout in seconds.
+        rate (float): Requests per second allowed across all threads.
+        retries (int): Number of retries of a rate limited request.
+    """
+
+    url = 'https://geocode.maps.co/search'
+
+    def __init__(self, api_key, session=None, timeout=10, rate=1, retries=3):
+        self.api_key = api_key
+        self.session = session or make_session()
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+
+    def geocode(self, name):
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            response = self.session.get(self.url, params={'q': name.strip(), 'api_key': self.api_key}, timeout=self.timeout)
+            if response.status_code != 429 or attempt == self.retries:
+                break
+            retry_after = response.headers.get('Retry-After', '')
+            time.sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+        # raise on rate limiting or server errors so they are not cached as misses
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+    def close(self):
+        self.session.close()
+
+
+class GazetteerGeocoder(Geocoder):
+    """Offline geocoder backed by a SQLite index of a GeoNames gazetteer dump.
+
+    Names are matched exactly first, then by word prefix (``palo pinto`` matches
+    ``palo pinto county``). Among several places with the same name the most
+    populous one wins. Build the index with ``build_gazetteer``.
+
+    Args:
+        path (str): Path to the gazetteer database.
+        prefix (bool): Whether to fall back to prefix matches.
+    """
+
+    def __init__(self, path='gazetteer.sqlite', prefix=True):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+
+    def geocode(self, name):
+        name = normalize_location(name)
+        if not name:
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT lat, lon FROM places WHERE name = ? ORDER BY population DESC LIMIT 1",
+                                    (name,)).fetchone()
+            if row is None and self.prefix:
+                # range scan on the name index, the trailing space keeps matches on word boundaries
+                row = self.conn.execute("SELECT lat, lon FROM places WHERE name > ? AND name < ? ORDER BY population DESC LIMIT 1",
+                                        (name + ' ', name + ' \uffff')).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def close(self):
+        self.conn.close()
+
+
+class FallbackGeocoder(Geocoder):
+    """Try each geocoder in turn and return the first hit."""
+
+    def __init__(self, *geocoders):
+        self.geocoders = geocoders
+
+    def geocode(self, name):
+        for geocoder in self.geocoders:
+            coordinates = geocoder.geocode(name)
+            if coordinates is not None:
+                return coordinates
+        return None
+
+    def close(self):
+        for geocoder in self.geocoders:
+            geocoder.close()
+
+
+def _read_geonames(path):
+    # yields the rows of a GeoNames dump, either the .txt or the .zip it is distributed in
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            name = [n for n in archive.namelist() if n.endswith('.txt') and not n.startswith('readme')][0]
+            with archive.open(name) as f:
+                yield from (line.rstrip('\n').split('\t') for line in io.TextIOWrapper(f, encoding='utf-8'))
+    else:
+        with open(path, encoding='utf-8') as f:
+            yield from (line.rstrip('\n').split('\t') for line in f)
+
+
+def build_gazetteer(dump_path, output='gazetteer.sqlite', alternate_names=False, feature_classes=None):
+    """Build the GazetteerGeocoder index from a GeoNames dump.
+
+    Dumps can be downloaded from https://download.geonames.org/export/dump/
+    (e.g. US.zip or allCountries.zip).
+
+    Args:
+        dump_path (str): Path to the GeoNames .txt or .zip file.
+        output (str): Path of the SQLite database to create.
+        alternate_names (bool): Also index the alternate names of each place.
+        feature_classes (list): GeoNames feature classes to keep (e.g. A, P, H, T), all if None.
+    """
+    conn = sqlite3.connect(output)
+    conn.execute("DROP TABLE IF EXISTS places")
+    conn.execute("CREATE TABLE places (name TEXT, lat REAL, lon REAL, population INTEGER, feature_class TEXT, country TEXT)")
+
+    def rows():
+        for fields in _read_geonames(dump_path):
+            if len(fields) < 15 or (feature_classes and fields[6] not in feature_classes):
+                continue
+            names = {fields[1], fields[2]}
+            if alternate_names and fields[3]:
+                names.update(fields[3].split(','))
+            lat, lon, population = float(fields[4]), float(fields[5]), int(fields[14] or 0)
+            for name in names:
+                name = normalize_location(name)
+                if name:
+                    yield name, lat, lon, population, fields[6], fields[8]
+
+    conn.executemany("INSERT INTO places VALUES (?, ?, ?, ?, ?, ?)", rows())
+    # building the index after the bulk insert is much faster than maintaining it
+    conn.execute("CREATE INDEX places_name ON places (name, population DESC)")
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+    conn.close()
+    print(f"Indexed {count} names into {output}")
+
+
+class GeocodeCache:
+    """Persistent cache of normalized location name -> (lat, lon).
+
+    Names that could not be resolved are stored too, with NULL coordinates, so
+    they are not looked up again.
+
+    Args:
+        path (str): Path to the SQLite database.
+    """
+
+    def __init__(self, path='geocode_cache.sqlite'):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS geocodes (name TEXT PRIMARY KEY, lat REAL, lon REAL, created_at REAL)")
+        self.conn.commit()
+
+    def get(self, name):
+        """Look up a name in the cache.
+
+        Returns:
+            tuple: (found, coordinates) where coordinates is None for cached misses.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT lat, lon FROM geocodes WHERE name = ?", (normalize_location(name),)).fetchone()
+        if row is None:
+            return False, None
+        if row[0] is None:
+            return True, None
+        return True, (row[0], row[1])
+
+    def put(self, name, coordinates):
+        lat, lon = coordinates if coordinates is not None else (None, None)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)",
+                              (normalize_location(name), lat, lon, time.time()))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class CachedGeocoder(Geocoder):
+    """Serve lookups from a GeocodeCache and only call ``geocoder`` on a miss."""
+
+    def __init__(self, geocoder, cache):
+        self.geocoder = geocoder
+        self.cache = cache
+
+    def geocode(self, name):
+        found, coordinates = self.cache.get(name)
+        if found:
+            return coordinates
+        coordinates = self.geocoder.geocode(name)
+        self.cache.put(name, coordinates)
+        return coordinates
+
+    def close(self):
+        self.geocoder.close()
+        self.cache.close()
+
+
+def geocode_locations(list_of_locs, geocoder, failed=None):
+    """Geocode a list of location names.
+
+    Args:
+        list_of_locs (list): Location names as extracted from the articles.
+        geocoder (Geocoder): Backend used for the lookups.
+        failed (list): If given, names whose lookup raised a request error (rate
+            limiting, network or server errors) are appended to it, so the caller
+            can retry them later instead of treating them as unknown.
+
+    Returns:
+        dict: name -> (lat, lon) for every name that could be resolved, keyed by the
+        names as given.
+    """
+    locations = {}
+    for loc in list_of_locs:
+        if not normalize_location(loc):
+            continue
+        try:
+            coordinates = geocoder.geocode(loc)
+        except requests.exceptions.RequestException as e:
+            print(f"Error geocoding {loc}: {e}")
+            if failed is not None:
+                failed.append(loc)
+            continue
+        except (ValueError, KeyError) as e:
+            print(f"Error geocoding {loc}: {e}")
+            continue
+        if coordinates is not None:
+            locations[loc] = coordinates
+    return locations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline gazetteer used by GazetteerGeocoder")
+    parser.add_argument("dump", type=str, help="GeoNames dump (.txt or .zip)")
+    parser.add_argument("--output", type=str, default="gazetteer.sqlite", help="SQLite database to create")
+    parser.add_argument("--alternate_names", action="store_true", help="Also index alternate names")
+    parser.add_argument("--feature_classes", type=str, nargs='+', default=None, help="GeoNames feature classes to keep")
+    args = parser.parse_args()
+    build_gazetteer(args.dump, args.output, args.alternate_names, args.feature_classes)
@@ -1,29 +1,27 @@
 # script to get search for something on the internet and return the first result
 
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-from tqdm import tqdm
 import google.generativeai as genai
-import os
 import datetime
-import calendar
 # from googleapi import google
 
-from os.path import join, isfile, isdir
-from os import mkdir
-import numpy as np
-import urllib.request
-from multiprocessing.dummy import Pool
-import csv
-from dateutil.relativedelta import relativedelta
+from os.path import isfile
+from functools import partial
+from article_fetcher import ArticleFetcher
+from article_store import ArticleStore
+from article_corpus import ArticleCorpus, canonical_url
+from image_center import find_coverage_center
+from imagery import EarthEngineProvider
+from event_images import get_images
+from downloader import ThumbnailDownloader
+from ee_executor import EERequestExecutor
+from tile_cache import TileCache
+from pipeline import Pipeline, Stage
+from job_ledger import JobLedger, inputs_hash
+from fema_metadata import FemaMetadata
+from records import event_record, read_records, record_line, write_records
+from geocode import CachedGeocoder, FallbackGeocoder, GazetteerGeocoder, GeocodeCache, HTTPGeocoder, geocode_locations
 # import wget
-import ee
-
-ee.Initialize(project='your-project-id')
-import pandas as pd
-from tqdm import tqdm
-from PIL import Image
 import time
 from time import sleep
 
@@ -37,30 +35,63 @@ model = genai.GenerativeModel("gemini-2.0-flash")
 
 geocode_API_key = 'your-key-here'  # Replace with your actual API key
 
-def mask_s2_clouds(image):
-  """Masks clouds in a Sentinel-2 image using the QA band.
-
-  Args:
-      image (ee.Image): A Sentinel-2 image.
-
-  Returns:
-      ee.Image: A cloud-masked Sentinel-2 image.
-  """
-  qa = image.select('QA60')
-
-  # Bits 10 and 11 are clouds and cirrus, respectively.
-  cloud_bit_mask = 1 << 10
-  cirrus_bit_mask = 1 << 11
-
-  # Both flags should be set to zero, indicating clear conditions.
-  mask = (
-      qa.bitwiseAnd(cloud_bit_mask)
-      .eq(0)
-      .And(qa.bitwiseAnd(cirrus_bit_mask).eq(0))
-  )
-
-  return image.updateMask(mask).divide(10000)
-
+# earth engine is initialized with this project when main starts, not at import time
+ee_project = 'your-project-id'
+
+# download rgb and the QA60 cloud bits of each scene in one request, with the cloud
+# mask computed locally and saved as png, instead of a second thumbnail per scene
+single_request_download = False
+
+# drop scenes whose cloud fraction over the event region is above this (0-1) before
+# downloading them, None downloads every scene. the fraction is computed with
+# 'metadata' (tile CLOUDY_PIXEL_PERCENTAGE), 'qa60' or 'probability' (S2_CLOUD_PROBABILITY),
+# only when max_cloud_fraction is set or scene_sampling is 'least_cloudy'
+max_cloud_fraction = None
+cloud_fraction_method = 'probability'
+
+# same-day tiles are mosaicked, and long events are subsampled to at most this many
+# image dates ('even' spacing or 'least_cloudy'), matching the limit in consolidate_captions.py
+per_day_mosaic = True
+max_scenes_per_event = 8
+scene_sampling = 'even'
+
+# directory of the tile cache shared by neighbouring events, None downloads every event
+# separately. events are cropped out of 0.2 degree tiles snapped to a 0.1 degree grid,
+# so adjacent counties of the same storm fetch each scene once
+tile_cache_dir = None
+
+# maximum number of earth engine requests in flight across all events, keep it
+# below the concurrent request quota of the project
+ee_max_in_flight = 16
+
+# worker threads of each stage of main, and capacity of the queues between the stages
+stage_workers = {'fetch': 4, 'summarize': 4, 'geocode': 2, 'images': 4, 'statements': 4}
+pipeline_queue_size = 8
+
+# per-event, per-stage progress, replaces skipping every event with a viz_images folder
+job_ledger_path = 'jobs.sqlite'
+# articles linked by several events are summarized once, the locations of each article are kept here
+article_corpus_path = 'article_corpus.sqlite'
+
+# one json record per event (see records.py), read by consolidate_captions.py and the
+# MONITRS_QA scripts, and if set, also converted to parquet at the end of the run
+output_path = 'new_viz.jsonl'
+parquet_output_path = None
+
+_default_geocoder = None
+
+def default_geocoder():
+    # built on first use, so importing the script creates no files
+    global _default_geocoder
+    if _default_geocoder is None:
+        # repeated location names are answered from the on-disk cache, and if an offline
+        # gazetteer has been built (python MONITRS/geocode.py US.zip) it is tried before the API
+        if isfile('gazetteer.sqlite'):
+            geocoder = FallbackGeocoder(GazetteerGeocoder('gazetteer.sqlite'), HTTPGeocoder(geocode_API_key))
+        else:
+            geocoder = HTTPGeocoder(geocode_API_key)
+        _default_geocoder = CachedGeocoder(geocoder, GeocodeCache('geocode_cache.sqlite'))
+    return _default_geocoder
 
 def summarize_text(text,startdate, enddate):
 
@@ -110,11 +141,8 @@ def summarize_text(text,startdate, enddate):
     except Exception as e:
         print(e)
         sleep(10)
-        try:
-            # summary = model.generate_content(f"Please, given these articles, could you pull out a list of proper noun locations in the article. responses should be string list format\n {text} \n if the article does not contain any information about the event, please return 'no'")
-            summary = model.generate_content(prompt)
-        except Exception as e:
-            return ''
+        # a second failure is raised so the job ledger records a failure to retry, not an article without locations
+        summary = model.generate_content(prompt)
     if summary.text == 'no':
         return ''
 
@@ -153,161 +181,10 @@ def get_statements(text,dates):
     
     return statements.text
 
-def get_images(center, starttime, endtime, incident_type, index):
-    halfwidth=0.05
-    odir='viz_images'
-    buffer_days = 5
-
-    min_lon = center[1] - halfwidth
-    max_lon = center[1] + halfwidth
-    min_lat = center[0] - halfwidth
-    max_lat = center[0] + halfwidth
- 
-
-    if not isdir(odir):
-        mkdir(odir)
-
-    
-    outdir = join(odir, str(index))
-
-    if not isdir(outdir):
-        mkdir(outdir)
-
-    # bounds is center +- halfwidth
-    region = ee.Geometry.Rectangle([[min_lon, min_lat], [max_lon, max_lat]])
-    
-    col = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-
-    col_cloud = ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY')
-
-    img = col.filterBounds(region)
-    cloudmask = col_cloud.filterBounds(region)
-   
-    # starttime and endtime are strings
-    start_date_str = starttime
-    start_date_buffer_str = (datetime.datetime.strptime(starttime, '%Y-%m-%d') - relativedelta(days=buffer_days)).strftime('%Y-%m-%d')
-    
-    end_date_str = endtime
-    # if endtime has 00:00:00, remove it
-    if len(endtime) > 10:
-        endtime = endtime[:10]
-    end_date_buffer_str = (datetime.datetime.strptime(endtime, '%Y-%m-%d') + relativedelta(days=buffer_days)).strftime('%Y-%m-%d')
-   
-    img = img.filterDate(start_date_buffer_str, end_date_buffer_str)
-
-
-    try:
-        num_images = img.size().getInfo()
-        print("num_images", num_images)
-        
-    except Exception as e:
-        print("Error getting number of images:", e)
-        return
-    
-   
-    # if there are no images in the collection, return
-    if num_images == 0:
-        print("No images found for event in SR Harmonized", index)
-        col = ee.ImageCollection('COPERNICUS/S2_HARMONIZED')
-        img = col.filterBounds(region)
-        img = img.filterDate(start_date_buffer_str, end_date_buffer_str)
-        try:
-            num_images = img.size().getInfo()
-            print("num_images found harmonized", num_images)
-        except Exception as e:
-            print("Error getting number of images:", e)
-            return
-        if num_images == 0:
-            print("No images found for event in Harmonized", index)
-            col = ee.ImageCollection('COPERNICUS/S2')
-            img = col.filterBounds(region)
-            img = img.filterDate(start_date_buffer_str, end_date_buffer_str)
-            try:
-                num_images = img.size().getInfo()
-                print("num_images found S2", num_images)
-            except Exception as e:
-                print("Error getting number of images:", e)
-                return
-            if num_images == 0:
-                print("No images found for event in S2, all tried", index)
-                return []
-
-    img = img.toList(num_images)
-    
-    dates_list = []
-    # iterate through the images and download them
-    for i in tqdm(range(num_images)):
-        image = img.get(i)
-        image = ee.Image(image)
-
-        img_date = image.date().format('YYYY-MM-dd').getInfo()
-        dates_list.append(img_date)
-        # create output file name
-        output_file = join(outdir, f'{index}_{img_date}.jpg')
-        if isfile(output_file):
-            continue
-
-        # Download the image
-        try:
-            url = image.getThumbURL({'bands': ['B4', 'B3', 'B2'], 'min': 0, 'max': 3000, 'gamma':1, 'dimensions': '512x512', 'region': region})
-            urllib.request.urlretrieve(url, output_file)
-            # if image is more than 30% black, redo the download
-            img_array = np.array(Image.open(output_file))
-            if np.mean(img_array) < 30:
-                # print("Image is too dark, redownloading...")
-                urllib.request.urlretrieve(url, output_file)
-            # if images is all white delete the image
-            if np.mean(img_array) > 200:
-                # print("Image is too white, deleting...")
-                os.remove(output_file)
-                continue
-        except ee.ee_exception.EEException as e:
-            print("error with image", e)
-            continue
-        
-        # download the cloud mask image
-        # find where QA60 band is and create a black and white image as cloud mask
-        cloud_image = mask_s2_clouds(image)
-        cloud_output_file = join(outdir, f'{index}_cloud_{img_date}.jpg')
-        
-        try:
-            # get cloud mask image for same date
-           
-            url = cloud_image.getThumbURL({'min': 0, 'max': 100, 'gamma':1, 'dimensions': '512x512', 'region': region})
-            urllib.request.urlretrieve(url, cloud_output_file)
-            img_array = np.array(Image.open(cloud_output_file))
-            # keep only the probability band
-            img_array = img_array[:,:,0]
-            # make any non black pixel white
-            img_array[img_array != 0] = 255
-            # save the image
-            Image.fromarray(img_array).save(cloud_output_file)
-        except ee.ee_exception.EEException as e:
-            print("error with cloud image", e)
-            continue
-           
-        
-    print(f"Downloaded images for event {index} ({incident_type})")
-    return dates_list
-
-
-def get_bounding_box(list_of_locs):
-    lats = []
-    lons = []
-    locations = {}
-    for loc in list_of_locs:
-        try:
-            link = f'https://geocode.maps.co/search?q={loc}&api_key={geocode_API_key}'
-            response = requests.get(link)
-            if response.json():
-                # print(response.json())
-                lat = float(response.json()[0]['lat'])
-                lon = float(response.json()[0]['lon'])
-                lats.append(lat)
-                lons.append(lon)
-                locations[loc] = (lat, lon)
-        except Exception as e:
-            continue
+def get_bounding_box(list_of_locs, geocoder=None):
+    locations = geocode_locations(list_of_locs, geocoder or default_geocoder())
+    lats = [lat for lat, lon in locations.values()]
+    lons = [lon for lat, lon in locations.values()]
     try:
         # get the bounding box
         min_lat = min(lats)
@@ -320,37 +197,11 @@ def get_bounding_box(list_of_locs):
     except Exception as e:
         return None, None
 
-def get_article_content(url):
-    print(f"Getting article content from {url}")
-    response = requests.get(url)
-    if response.status_code == 200:
-        soup = BeautifulSoup(response.text, 'html.parser')
-        # Extract the title and content of the article
-        title = soup.title.string if soup.title else 'No title found'
-        paragraphs = soup.find_all('p')
-        content = ' '.join([para.get_text() for para in paragraphs])
-        return title, content
-    else:
-        return None, None
-
-def get_image_center(list_of_locs, fema_center):
+def get_image_center(list_of_locs, fema_center, geocoder=None, failed=None):
     # find center for square of 0.1 degrees maximizing the number of locations within the square
-    lats = []
-    lons = []
-    locations = {}
-    for loc in list_of_locs:
-        try:
-            link = f'https://geocode.maps.co/search?q={loc}&api_key=6765c55c11f9b212367893hxkb616bc'
-            response = requests.get(link)
-            if response.json():
-                # print(response.json())
-                lat = float(response.json()[0]['lat'])
-                lon = float(response.json()[0]['lon'])
-                lats.append(lat)
-                lons.append(lon)
-                locations[loc] = (lat, lon)
-        except Exception as e:
-            continue
+    locations = geocode_locations(list_of_locs, geocoder or default_geocoder(), failed)
+    lats = [lat for lat, lon in locations.values()]
+    lons = [lon for lat, lon in locations.values()]
     try:
         
          # Find optimal square center
@@ -361,25 +212,8 @@ def get_image_center(list_of_locs, fema_center):
         lats.append(fema_center[0])
         lons.append(fema_center[1])
             
-        # Create grid of potential centers
-        lat_min, lat_max = min(lats), max(lats)
-        lon_min, lon_max = min(lons), max(lons)
-        
-        best_count = 0
-        best_center = (None, None)
-        
-        # Check each location as potential center
-        for lat in lats:
-            for lon in lons:
-                count = sum(1 for loc_lat, loc_lon in zip(lats, lons)
-                          if abs(loc_lat - lat) <= 0.05 and abs(loc_lon - lon) <= 0.05)
-                
-                # ensure that fema center is within the square
-                fema_in_square = (lat - 0.05 <= fema_center[0] <= lat + 0.05) and (lon - 0.05 <= fema_center[1] <= lon + 0.05)
-                
-                if count > best_count and fema_in_square:
-                    best_count = count
-                    best_center = (lat, lon)
+        # best 0.1 degree square among all (lat, lon) pairs, see image_center.py
+        best_center = find_coverage_center(lats, lons, fema_center, halfwidth=0.05)
 
         # # only keep locations that are within 0.05 degrees of the center
         # locations = {loc: (lat, lon) for loc, (lat, lon) in locations.items()
@@ -391,11 +225,164 @@ def get_image_center(list_of_locs, fema_center):
         return None, None
 
 
+def article_texts(urls, fetcher):
+    # text of every reachable article, and the text sent to gemini for the event
+    articles = fetcher.fetch_all(urls)
+    texts = {url: articles[url][1] for url in urls if articles[url][1]}
+    content = ''
+    for article_content in texts.values():
+        content += article_content + '\n'
+    return texts, content
+
+def fetch_event(event, fetcher, fema):
+    # pipeline stage: fema dates and article text of an event
+    event_index = event['index']
+    print(f"Processing event {event_index} with {len(event['links'])} links")
+    # get the dates from the fema table using the index
+    try:
+        start_date = fema[event_index]['incidentBeginDate']
+    except Exception as e:
+        print(f"Error getting start date for index {event_index}: {e}")
+        return None
+    # get date with day of week like "2021-01-01, Friday"
+    str_start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y-%m-%d, %A')
+    end_date = fema[event_index]['incidentEndDate']
+    # if date has 00:00:00, remove it
+    if len(end_date) > 10:
+        end_date = end_date[:10]
+    str_end_date = datetime.datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y-%m-%d, %A')
+
+    # get the article content for all links, a url shared with events in flight is downloaded once
+    articles, content = article_texts(event['links'], fetcher)
+
+    if not content:
+        # the links may be temporarily unreachable, fail so the next run tries again
+        raise RuntimeError(f"No article content for event {event_index}")
+    event.update(start_date=start_date, end_date=end_date, str_start_date=str_start_date,
+                 str_end_date=str_end_date, article_urls=list(articles), articles=articles, content=content)
+    return event
+
+def decode_articles(outputs, fetcher):
+    # the job ledger only keeps the urls, the text is read back from the article store
+    articles, content = article_texts(outputs['article_urls'], fetcher)
+    return dict(outputs, articles=articles, content=content)
+
+def extract_locations(content, str_start_date, str_end_date):
+    # locations gemini finds in an article, or in the joined articles of an event
+    try:
+        list_of_locs = summarize_text(content, str_start_date, str_end_date)
+    except requests.exceptions.RequestException as e:
+        print(f"Error summarizing content: {e}")
+         # if error due to too many requests, wait for 10 seconds and try again
+        print("waiting for 10 seconds...")
+        time.sleep(10)
+        try:
+            print("Trying again...")
+            list_of_locs = summarize_text(content, str_start_date, str_end_date)
+        except requests.exceptions.RequestException as e:
+            print(f"Error summarizing content: {e} skipping...")
+            raise
+
+    if list_of_locs == '':
+        return []
+
+    list_of_locs = list_of_locs[list_of_locs.find("[")+1:list_of_locs.find("]")]
+    return [loc.strip() for loc in list_of_locs.split(',') if loc.strip()]
+
+def summarize_event(event, corpus, shared_urls):
+    # pipeline stage: locations mentioned in the articles
+    print("summarize_text")
+    extract = partial(extract_locations, str_start_date=event['str_start_date'], str_end_date=event['str_end_date'])
+    list_of_locs = []
+    # articles of this event only are sent together in one request, as before
+    own_content = ''
+    for url, content in event['articles'].items():
+        if url not in shared_urls:
+            own_content += content + '\n'
+    if own_content:
+        list_of_locs.extend(extract(own_content))
+    # articles linked by several events are sent to gemini once, the others reuse their locations from the corpus
+    for url, content in event['articles'].items():
+        if url in shared_urls:
+            list_of_locs.extend(corpus.locations(url, content, extract))
+
+    if not list_of_locs:
+        return None
+
+    # remove duplicates
+    event['list_of_locs'] = list(set(list_of_locs))
+    return event
+
+def locate_event(event, fema, geocoder=None):
+    # pipeline stage: geocoded locations and image center
+    print("get_bounding_box")
+    event_index = event['index']
+    fema_lat = fema[event_index]['lat']
+    fema_lon = fema[event_index]['lon']
+    fema_center = (fema_lat, fema_lon)
+
+    failed = []
+    center, locations = get_image_center(event['list_of_locs'], fema_center, geocoder, failed)
+    # raised so the job ledger records a failure to retry, not an event without a center
+    if failed:
+        raise RuntimeError(f"Geocoding failed for {len(failed)} locations of event {event_index}")
+    if center is None:
+        raise RuntimeError(f"No image center for event {event_index}")
+    event['center'], event['locations'] = center, locations
+    return event
+
+def decode_locations(outputs):
+    # the center and coordinates come back from the job ledger as lists
+    center = tuple(outputs['center']) if outputs['center'] is not None else None
+    locations = {name: tuple(coordinates) for name, coordinates in outputs['locations'].items()} if outputs['locations'] is not None else None
+    return {'center': center, 'locations': locations}
+
+def image_event(event, fema, **image_kwargs):
+    # pipeline stage: sentinel-2 images of the event, see get_images for the keyword arguments
+    print("get_images")
+    event_index = event['index']
+    # get images from google earth engine for the bounding box from start_date to end_date
+    try:
+        dates = get_images(event['center'], event['start_date'], event['end_date'], fema[event_index]['incidentType'], event_index,
+                           **image_kwargs)
+    except Exception as e:
+        print(f"Error getting images for index {event_index}: {e}")
+        raise
+    if dates is None:
+        raise RuntimeError(f"Scene query or image downloads failed for event {event_index}")
+    if not dates:
+        return None
+    event['dates'] = dates
+    return event
+
+def statement_event(event):
+    # pipeline stage: statements for the image dates
+    print("get_statements")
+    # get text from article corresponding to the image dates
+    try:
+        statements = get_statements(event['content'], event['dates'])
+    except requests.exceptions.RequestException as e:
+        # wait for 10 seconds and try again
+        print(f"Error getting statements: {e}")
+        time.sleep(20)
+        try:
+            statements = get_statements(event['content'], event['dates'])
+        except requests.exceptions.RequestException as e:
+            print(f"Error getting statements: {e}")
+            raise
+    if not statements:
+        return None
+    # remove newlines from statements
+    event['statements'] = statements.replace('\n', ' ')
+    return event
+
+
 def main():
     # read the csv file
     csv = open("small_articles.csv", "r").readlines()
-    f = open('new_viz.csv', 'a+')  # Open the CSV file in append mode
-    df = pd.read_csv('FEMA_filtered_processed.csv', header=0)
+    f = open(output_path, 'a+', encoding='utf-8')  # Open the output file in append mode
+    # loaded once and keyed by index, every lookup below is a dict access
+    fema = FemaMetadata('FEMA_filtered_processed.csv')
    
 
     
@@ -406,113 +393,86 @@ def main():
         index = int(line[:line.find(",")])
         if index not in events:
             events[index] = []
-        events[index].append(line.split(",")[1])
+        # the same article is often found for several events, one url per article
+        link = canonical_url(line.split(",")[1])
+        if link not in events[index]:
+            events[index].append(link)
     
-    skip_indices = os.listdir('viz_images')
-    skip_indices = [int(i) for i in skip_indices if i.isdigit()]
-    events = {k: v for k, v in events.items() if k not in skip_indices}
-
+    # drop black listed links before anything is downloaded
     for event_index, links in events.items():
-        print(f"Processing event {event_index} with {len(links)} links")
-        # get the dates from df using the index
-        try:
-            start_date = df.loc[df['index'] == event_index, 'incidentBeginDate'].values[0]
-        except Exception as e:
-            print(f"Error getting start date for index {event_index}: {e}")
-            continue
-        # get date with day of week like "2021-01-01, Friday"
-        str_start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y-%m-%d, %A')
-        end_date = df.loc[df['index'] == event_index, 'incidentEndDate'].values[0]
-        # if date has 00:00:00, remove it
-        if len(end_date) > 10:
-            end_date = end_date[:10]
-        str_end_date = datetime.datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y-%m-%d, %A')
-
-        # get the article content for all links
-        content = ''
         for link in links:
-            for black in black_list:
-                if black in link:
-                    print(f"Skipping link {link} due to black list")
-                    continue
-            title, article_content = get_article_content(link)
-            if article_content:
-                content += article_content + '\n'
-        
-        if not content:
-            continue
-
-        print("summarize_text")
-        try:
-            list_of_locs = summarize_text(content, str_start_date, str_end_date)
-        except requests.exceptions.RequestException as e:
-            print(f"Error summarizing content: {e}")
-             # if error due to too many requests, wait for 10 seconds and try again
-            print("waiting for 10 seconds...")
-            time.sleep(10)
-            try:
-                print("Trying again...")
-                list_of_locs = summarize_text(content, str_start_date, str_end_date)
-            except requests.exceptions.RequestException as e:
-                print(f"Error summarizing content: {e} skipping...")
-                continue
-
-        if list_of_locs == '':
-            continue
-        
-        print("get_bounding_box")
-
-        list_of_locs = list_of_locs[list_of_locs.find("[")+1:list_of_locs.find("]")]
-        list_of_locs = list_of_locs.split(',')
-        # remove duplicates
-        list_of_locs = list(set(list_of_locs))
-
-       
-        fema_lat = df.loc[df['index'] == event_index, 'lat'].values[0]
-        fema_lon = df.loc[df['index'] == event_index, 'lon'].values[0]
-        fema_center = (fema_lat, fema_lon)
-
-        if len(list_of_locs) == 0:
-            print("No locations found in article")
-            locations = {f"FEMA location {event_index}": (fema_lat, fema_lon)}
-            print("FEMA location", center)
-
-        center, locations = get_image_center(list_of_locs, fema_center)
-
-        print("get_images")
-
-        # get images from google earth engine for the bounding box from start_date to end_date
-        try:
-            dates = get_images(center, start_date, end_date, df.loc[df['index'] == event_index, 'incidentType'].values[0], event_index)
-        except Exception as e:
-            print(f"Error getting images for index {event_index}: {e}")
-            continue
-        if not dates:
-            continue
-
-        print("get_statements")
-        # get text from article corresponding to the image dates
-        try:
-            statements = get_statements(content, dates)
-        except requests.exceptions.RequestException as e:
-            # wait for 10 seconds and try again
-            print(f"Error getting statements: {e}")
-            time.sleep(20)
-            try:
-                statements = get_statements(content, dates)
-            except requests.exceptions.RequestException as e:
-                print(f"Error getting statements: {e}")
-                continue
-        if not statements:
+            if any(black in link for black in black_list):
+                print(f"Skipping link {link} due to black list")
+        events[event_index] = [link for link in links if not any(black in link for black in black_list)]
+
+    # articles already downloaded by a previous run are served from the store
+    store = ArticleStore('article_cache')
+    fetcher = ArticleFetcher(store=store)
+    # articles found for several events (adjacent counties, same storm) are summarized on their own and shared
+    corpus = ArticleCorpus(article_corpus_path)
+    for event_index, links in events.items():
+        corpus.link(event_index, links)
+    shared_urls = corpus.shared_urls()
+    provider = EarthEngineProvider(ee_project)
+    geocoder = default_geocoder()
+    ee_executor = EERequestExecutor(ee_max_in_flight)
+    downloader = ThumbnailDownloader(executor=ee_executor)
+    tile_cache = TileCache(tile_cache_dir) if tile_cache_dir else None
+    image_kwargs = dict(downloader=downloader, single_request=single_request_download, cloud_method=cloud_fraction_method,
+                        max_cloud=max_cloud_fraction, mosaic=per_day_mosaic, max_scenes=max_scenes_per_event,
+                        sampling=scene_sampling, tile_cache=tile_cache, executor=ee_executor, provider=provider)
+
+    # the ledger records the status and outputs of every stage of every event, so a
+    # restart resumes each event at the stage that failed or was interrupted, and only
+    # reruns stages whose inputs changed
+    ledger = JobLedger(job_ledger_path)
+    image_settings = [v for k, v in sorted(image_kwargs.items()) if k in ('single_request', 'cloud_method', 'max_cloud', 'mosaic', 'max_scenes', 'sampling')]
+
+    # every stage has its own workers, so article downloads, gemini calls, geocoding and
+    # earth engine requests of different events overlap, and the bounded queues between
+    # the stages keep only a few events in memory
+    pipeline = Pipeline([
+        Stage('fetch', ledger.track('fetch', partial(fetch_event, fetcher=fetcher, fema=fema), ['links'],
+                                    ['start_date', 'end_date', 'str_start_date', 'str_end_date', 'article_urls'],
+                                    decode=partial(decode_articles, fetcher=fetcher)), stage_workers['fetch']),
+        Stage('summarize', ledger.track('summarize', partial(summarize_event, corpus=corpus, shared_urls=shared_urls),
+                                        ['content', 'str_start_date', 'str_end_date'],
+                                        ['list_of_locs']), stage_workers['summarize']),
+        Stage('geocode', ledger.track('geocode', partial(locate_event, fema=fema, geocoder=geocoder), ['list_of_locs'], ['center', 'locations'],
+                                      decode=decode_locations), stage_workers['geocode']),
+        Stage('images', ledger.track('images', partial(image_event, fema=fema, **image_kwargs), ['center', 'start_date', 'end_date'], ['dates'],
+                                     extra=image_settings), stage_workers['images']),
+        Stage('statements', ledger.track('statements', statement_event, ['content', 'dates'], ['statements']), stage_workers['statements']),
+    ], queue_size=pipeline_queue_size)
+    items = ({'index': event_index, 'links': links} for event_index, links in events.items())
+    # the results are written from this thread only, once per event and set of outputs
+    for event in pipeline.run(items):
+        line = record_line(event_record(event['index'], event['links'], event['center'], event['locations'], event['statements']))
+        previous = ledger.get(event['index'], 'write')
+        if previous is not None and previous[:2] == ('done', inputs_hash(line)):
             continue
-        # remove newlines from statements
-        statements = statements.replace('\n', ' ')
-        f.write(f"{event_index},{links},{center},{locations},[{statements}]\n")
+        f.write(line)
         f.flush()
+        ledger.finish(event['index'], 'write', inputs_hash(line), {})
     f.close()
+    if parquet_output_path:
+        write_records(read_records(output_path), parquet_output_path)
+    fetcher.close()
+    downloader.close()
+    store.close()
+    if tile_cache is not None:
+        tile_cache.close()
+    # time spent in each stage and latency of the earth engine requests by type
+    pipeline.report()
+    ee_executor.report()
+    print("Job ledger", ledger.summary())
+    articles, links, summarized = corpus.stats()
+    print(f"Article corpus: {articles} unique articles for {links} event links, {len(shared_urls)} shared, {summarized} summarized alone")
+    corpus.close()
+    ledger.close()
     print("Done")
 
     
 
 if __name__ == "__main__":
-    main()  # Call the main function to execute the script
\ No newline at end of file
+    main()  # Call the main function to execute the script
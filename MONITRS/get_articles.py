@@ -1,47 +1,230 @@
 # script to get articles from google search
+import argparse
+import json
+import re
+import sqlite3
+import threading
+import time
+from os.path import isfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
 import pandas as pd
 from tqdm import tqdm
 import googlesearch
 
+from rate_limit import TokenBucket
+
+
+def normalize_query(query):
+    # lowercase, drop timestamps and punctuation so near-identical queries share a key
+    query = query.lower()
+    query = re.sub(r't\d{2}:\d{2}:\d{2}(\.\d+)?z?', '', query)
+    query = re.sub(r'[^\w\s-]', ' ', query)
+    return ' '.join(query.split())
+
+
+class SearchCache:
+    """On-disk cache of normalized search query -> result links.
+
+    Args:
+        path (str): Path to the SQLite database.
+        ttl_days (float): Entries older than this are treated as missing and evicted.
+    """
+
+    def __init__(self, path='search_cache.sqlite', ttl_days=30):
+        self.ttl = ttl_days * 24 * 3600
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, links TEXT, fetched_at REAL)")
+        self.evict_expired()
+
+    def evict_expired(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM searches WHERE fetched_at < ?", (time.time() - self.ttl,))
+            self.conn.commit()
+
+    def get(self, query):
+        with self.lock:
+            row = self.conn.execute("SELECT links, fetched_at FROM searches WHERE query = ?",
+                                    (normalize_query(query),)).fetchone()
+        if row is None or row[1] < time.time() - self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, query, links):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)",
+                              (normalize_query(query), json.dumps(links), time.time()))
+            self.conn.commit()
 
+    def close(self):
+        self.conn.close()
 
-def get_article(search_query):
-    
+
+def get_article(search_query, bucket=None, cache=None):
+
+    if cache is not None:
+        links = cache.get(search_query)
+        if links is not None:
+            return links
+
+    # pacing is handled by the shared token bucket, so googlesearch does not need to sleep
+    if bucket is not None:
+        bucket.acquire()
     # retrieve first 5 links from google search
-    search_results = googlesearch.search(search_query, num_results=5, unique=True, sleep_interval=5)
-    return search_results
-            
+    search_results = googlesearch.search(search_query, num_results=5, unique=True, sleep_interval=0 if bucket else 5)
+    links = list(search_results)
+    if cache is not None:
+        cache.put(search_query, links)
+    return links
+
+
+def search_worker(query, bucket, cache):
+    try:
+        return get_article(query, bucket, cache)
+    except Exception as e:
+        print(f"Error searching for {query}: {e}")
+        return None
+
+
+def search_all(queries, workers=4, rate=0.2, cache=None):
+    """Run the searches concurrently and yield results as they complete.
+
+    Queries that normalize to the same key are collapsed into a single search whose
+    links are reported for every index that asked for it. At most ``2 * workers``
+    distinct searches are in flight at any time, so ``queries`` can be a lazy iterator.
+
+    Args:
+        queries (iterable): (index, query) pairs.
+        workers (int): Number of concurrent search workers.
+        rate (float): Searches per second allowed across all workers.
+        cache (SearchCache): Optional persistent cache consulted before searching.
+
+    Yields:
+        tuple: (index, list of links) in completion order. The links are None if
+        the search failed.
+    """
+    bucket = TokenBucket(rate)
+    # normalized query -> indices waiting on it
+    waiting = {}
 
+    def finish(done):
+        for future in done:
+            links = future.result()
+            for idx in waiting.pop(future.key):
+                yield idx, links
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for idx, query in queries:
+            key = normalize_query(query)
+            if key in waiting:
+                waiting[key].append(idx)
+                continue
+            waiting[key] = [idx]
+            future = executor.submit(search_worker, query, bucket, cache)
+            future.key = key
+            pending.add(future)
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finish(done)
+        yield from finish(as_completed(pending))
+
+
+QUERY_COLUMNS = ['declarationTitle', 'incidentType', 'designatedArea', 'state', 'incidentBeginDate']
+
+
+def build_queries(path, chunksize=10000, skip=()):
+    """Stream the FEMA csv in chunks and yield a search query per row.
+
+    Queries are built with vectorized string concatenation over each chunk and only
+    the columns used in the query are parsed.
+
+    Args:
+        path (str): Path to the FEMA declarations csv.
+        chunksize (int): Number of rows read per chunk.
+        skip (set): Row indices that should not be searched again.
+
+    Yields:
+        tuple: (row index, query string).
+    """
+    for chunk in pd.read_csv(path, header=0, usecols=QUERY_COLUMNS, chunksize=chunksize):
+        if skip:
+            chunk = chunk[~chunk.index.isin(skip)]
+        queries = chunk[QUERY_COLUMNS[0]].astype(str)
+        for col in QUERY_COLUMNS[1:]:
+            queries = queries + ' ' + chunk[col].astype(str)
+        yield from zip(queries.index, queries.values)
+
+
+class ProgressLedger:
+    """Append-only record of the FEMA indices whose search results are in articles.csv.
+
+    If the ledger file does not exist yet it is seeded from the indices already
+    present in ``articles_path``, so runs started before the ledger existed resume too.
+
+    Args:
+        path (str): Path to the ledger file, one index per line.
+        articles_path (str): Path to the articles csv used to seed a new ledger.
+    """
+
+    def __init__(self, path='articles_progress.txt', articles_path='articles.csv'):
+        self.done = set()
+        if isfile(path):
+            with open(path) as f:
+                self.done.update(int(line) for line in f if line.strip())
+        elif isfile(articles_path):
+            with open(articles_path) as f:
+                self.done.update(int(line[:line.find(",")]) for line in f if line[:line.find(",")].isdigit())
+        self.f = open(path, 'a+')
+        if self.done and self.f.tell() == 0:
+            self.f.write(''.join(f"{idx}\n" for idx in sorted(self.done)))
+            self.f.flush()
+
+    def __contains__(self, idx):
+        return idx in self.done
+
+    def mark_done(self, idx):
+        self.done.add(idx)
+        self.f.write(f"{idx}\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
 
 
 def main():
-    # read the csv file
-    df = pd.read_csv('FEMA_filtered.csv', header=0)
-    print(f"Number of rows: {len(df)}")
-    
-    # create a search query for all rows
-    queries = []
-    for idx, row in df.iterrows():
-        query = f"{row['declarationTitle']} {row['incidentType']} {row['designatedArea']} {row['state']} {row['incidentBeginDate']}"
-        queries.append((idx, query))
-    
-    print(f"Number of queries: {len(queries)}")
+    parser = argparse.ArgumentParser(description="Search the web for articles on each FEMA declaration")
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent search workers")
+    parser.add_argument("--rate", type=float, default=0.2, help="Maximum searches per second across all workers")
+    parser.add_argument("--cache", type=str, default="search_cache.sqlite", help="Path to the search result cache")
+    parser.add_argument("--cache_ttl_days", type=float, default=30, help="Age after which cached results are searched again")
+    parser.add_argument("--progress", type=str, default="articles_progress.txt", help="Ledger of FEMA indices already searched")
+    parser.add_argument("--fema_csv", type=str, default="FEMA_filtered.csv", help="FEMA declarations csv to build queries from")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Number of FEMA rows read at a time")
+    args = parser.parse_args()
+    cache = SearchCache(args.cache, args.cache_ttl_days)
+    progress = ProgressLedger(args.progress)
+
+    queries = build_queries(args.fema_csv, args.chunksize, skip=progress.done)
+    print(f"{len(progress.done)} rows already done")
 
     f = open('articles.csv', 'a+')  # Open the CSV file in append mode
 
-    for i,search_query in tqdm(enumerate(queries)):
-        # print(f"---------------------Query {i+1}/{len(queries)}: {search_query[1]}")
-       
-        links = get_article(search_query[1])
-        
-        
+    # rows are written in completion order as soon as each search returns
+    for idx, links in tqdm(search_all(queries, args.workers, args.rate, cache)):
+        # failed searches are left out of the ledger so the next run retries them
+        if links is None:
+            continue
         for link in links:
-            # print(f"{search_query[0]},{link},\n")
-            f.write(f"{search_query[0]},{link},\n")
-        
+            f.write(f"{idx},{link},\n")
+
         f.flush()
-       
+        progress.mark_done(idx)
+
     f.close()
-   
+    progress.close()
+    cache.close()
+
 if __name__ == "__main__":
-    main()  # Call the main function to execute the script
\ No newline at end of file
+    main()  # Call the main function to execute the script
@@ -0,0 +1,244 @@
+# extraction backends that pull the title and paragraph text out of an article page
+#
+# every backend returns (title, content) in the same form as the original
+# BeautifulSoup implementation: the text of the first <title> (or 'No title found')
+# and the text of every <p> joined by single spaces.
+
+from html.parser import HTMLParser
+
+
+def extract_bs4(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    # Extract the title and content of the article
+    title = soup.title.string if soup.title else 'No title found'
+    paragraphs = soup.find_all('p')
+    content = ' '.join([para.get_text() for para in paragraphs])
+    return title, content
+
+
+class TitleParagraphCollector:
+    """Streaming parser target that only keeps <title> and <p> text.
+
+    Paragraphs are recorded in the order their start tags appear and text inside a
+    nested <p> counts towards every open paragraph, as with ``find_all('p')``. An end
+    tag closes every element opened after its matching start tag, the way the
+    BeautifulSoup tree builder recovers unclosed tags. Script and style contents are
+    ignored, matching ``get_text``.
+
+    Text is buffered into the same strings the BeautifulSoup tree would hold: a
+    string ends at any tag, comment, CDATA section or declaration, and a string of
+    only whitespace becomes a single space (or newline) outside <pre> and
+    <textarea>. Comments and declarations are left out of paragraphs, CDATA is
+    kept. The children of <title> are kept as a small tree, since ``Tag.string``
+    looks through single children.
+    """
+
+    skip_tags = ('script', 'style', 'template')
+    # the empty element tags of BeautifulSoup's html tree builder
+    void_tags = ('area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image', 'img',
+                 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr')
+    preserve_whitespace_tags = ('pre', 'textarea')
+    ascii_spaces = '\x20\x0a\x09\x0c\x0d'
+
+    def __init__(self):
+        self.seen_title = False
+        self.title = None
+        self.title_children = None
+        self.paragraphs = []
+        self.open_paragraphs = []
+        self.skip_depth = 0
+        self.text = []
+        # open elements as (tag, paragraph index or None, children list if inside <title> or None)
+        self.stack = []
+
+    def _parent(self):
+        # children list of the innermost open element of the title, None outside it
+        return self.stack[-1][2] if self.stack else None
+
+    def _flush(self, kind='text'):
+        # end the current string, like BeautifulSoup.endData
+        if not self.text:
+            return
+        text = ''.join(self.text)
+        self.text = []
+        if (not any(tag in self.preserve_whitespace_tags for tag, _, _ in self.stack)
+                and all(c in self.ascii_spaces for c in text)):
+            text = '\n' if '\n' in text else ' '
+        parent = self._parent()
+        if parent is not None:
+            parent.append(text)
+        if kind in ('text', 'cdata') and not self.skip_depth:
+            for i in self.open_paragraphs:
+                self.paragraphs[i].append(text)
+
+    def _special(self, text, kind):
+        # a comment, cdata section or declaration is a string of its own
+        self._flush()
+        self.text.append(text)
+        self._flush(kind)
+
+    def start(self, tag, attrib=None):
+        self._flush()
+        tag = tag.lower()
+        parent = self._parent()
+        children = [] if parent is not None else None
+        if parent is not None:
+            parent.append(children)
+        if tag in self.void_tags:
+            return
+        paragraph = None
+        if tag in self.skip_tags:
+            self.skip_depth += 1
+        elif tag == 'title' and not self.seen_title:
+            self.seen_title = True
+            children = self.title_children = []
+        elif tag == 'p':
+            paragraph = len(self.paragraphs)
+            self.open_paragraphs.append(paragraph)
+            self.paragraphs.append([])
+        self.stack.append((tag, paragraph, children))
+
+    def end(self, tag):
+        self._flush()
+        tag = tag.lower()
+        if not any(open_tag == tag for open_tag, _, _ in self.stack):
+            return
+        while self.stack:
+            open_tag, paragraph, children = self.stack.pop()
+            if open_tag in self.skip_tags:
+                self.skip_depth -= 1
+            if children is not None and children is self.title_children:
+                self.title = self._string(children)
+            elif paragraph is not None:
+                self.open_paragraphs.remove(paragraph)
+            if open_tag == tag:
+                break
+
+    def data(self, text):
+        self.text.append(text)
+
+    def comment(self, text):
+        self._special(text, 'comment')
+
+    def cdata(self, text):
+        self._special(text, 'cdata')
+
+    def declaration(self, text):
+        self._special(text, 'declaration')
+
+    def pi(self, target, data=None):
+        self._special(target if data is None else f'{target} {data}', 'declaration')
+
+    def _string(self, children):
+        # Tag.string: the only child string, looking through single child elements
+        if len(children) != 1:
+            return None
+        child = children[0]
+        if isinstance(child, str):
+            return child
+        return self._string(child)
+
+    def close(self):
+        self._flush()
+        if not self.seen_title:
+            title = 'No title found'
+        elif any(children is self.title_children for _, _, children in self.stack):
+            # unterminated <title>
+            title = self._string(self.title_children)
+        else:
+            title = self.title
+        return title, ' '.join(''.join(parts) for parts in self.paragraphs)
+
+
+def extract_lxml(html):
+    from lxml import etree
+
+    collector = TitleParagraphCollector()
+    parser = etree.HTMLParser(target=collector, encoding='utf-8')
+    try:
+        parser.feed(html.encode('utf-8'))
+        return parser.close()
+    except etree.LxmlError:
+        # empty or badly broken documents, keep whatever was collected
+        return collector.close()
+
+
+class _StreamParser(HTMLParser):
+
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+        # like BeautifulSoup, a later </br> after <br> is dropped without ending the current string
+        self.already_closed = []
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag)
+        if tag in self.collector.void_tags:
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag)
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.already_closed:
+            self.already_closed.remove(tag)
+            return
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+    def handle_comment(self, data):
+        self.collector.comment(data)
+
+    def handle_decl(self, decl):
+        self.collector.declaration(decl[len('DOCTYPE '):])
+
+    def handle_pi(self, data):
+        self.collector.pi(data)
+
+    def unknown_decl(self, data):
+        # BeautifulSoup keeps the text of a CDATA section, other declarations are dropped
+        if data.upper().startswith('CDATA['):
+            self.collector.cdata(data[len('CDATA['):])
+        else:
+            self.collector.declaration(data)
+
+
+def extract_stream(html):
+    # pure python fallback, uses the same tokenizer as BeautifulSoup's html.parser
+    collector = TitleParagraphCollector()
+    parser = _StreamParser(collector)
+    parser.feed(html)
+    parser.close()
+    return collector.close()
+
+
+EXTRACTORS = {
+    'bs4': extract_bs4,
+    'lxml': extract_lxml,
+    'stream': extract_stream,
+}
+
+
+def get_extractor(name=None):
+    """Look up an extraction backend by name.
+
+    ``stream`` replays the html.parser events the way the BeautifulSoup tree builder
+    does, including comments, CDATA and whitespace-only strings. The one known
+    difference is a bare ``&name`` at the very end of a document, which BeautifulSoup
+    drops and ``stream`` keeps. ``lxml`` is faster still,
+    but recovers malformed markup with the HTML5 rules (e.g. an unclosed <p> ends at
+    the next <li>), so its text can differ on broken pages. Run
+    benchmark_html_extract.py to compare them on a stored corpus.
+
+    Args:
+        name (str): One of ``EXTRACTORS``, defaults to ``stream``.
+
+    Returns:
+        callable: Function mapping an html string to (title, content).
+    """
+    return EXTRACTORS[name or 'stream']
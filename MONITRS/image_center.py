@@ -0,0 +1,91 @@
+# search for the image square that covers the most geocoded locations
+
+import numpy as np
+
+
+def _covering_range(candidates, values, halfwidth):
+    """For each value find the candidates c with abs(value - c) <= halfwidth.
+
+    ``candidates`` must be sorted, so the matching candidates form a contiguous
+    range. Its ends are located with searchsorted and then nudged with the exact
+    predicates, so float rounding at the edges gives the same answer as comparing
+    every pair.
+
+    Returns:
+        tuple: (lo, hi) arrays, the matching candidates are candidates[lo:hi].
+    """
+    n = len(candidates)
+
+    def nudge(bound, past):
+        # move each bound to the first candidate for which past(value, candidate) holds
+        while True:
+            step = (bound > 0) & past(values, candidates[np.maximum(bound - 1, 0)])
+            if not step.any():
+                break
+            bound[step] -= 1
+        while True:
+            step = (bound < n) & ~past(values, candidates[np.minimum(bound, n - 1)])
+            if not step.any():
+                break
+            bound[step] += 1
+        return bound
+
+    lo = nudge(np.searchsorted(candidates, values - halfwidth, 'left'), lambda v, c: v - c <= halfwidth)
+    hi = nudge(np.searchsorted(candidates, values + halfwidth, 'right'), lambda v, c: v - c < -halfwidth)
+    return lo, hi
+
+
+def find_coverage_center(lats, lons, fema_center, halfwidth=0.05):
+    """Find the square center covering the most points while containing the FEMA center.
+
+    Every (lat, lon) pair taken from the point coordinates is a candidate center,
+    and a point is covered if it lies within ``halfwidth`` of the center on both
+    axes. Instead of counting the points for every candidate, each point adds one
+    to the rectangle of candidate centers that cover it, using a 2D difference array
+    over the sorted candidate coordinates. That takes O(n log n + A * B) for A
+    candidate latitudes and B candidate longitudes instead of O(A * B * n). Ties are
+    broken in favour of the first candidate in input order, as the original
+    pairwise search did.
+
+    Args:
+        lats (list): Latitudes of the points.
+        lons (list): Longitudes of the points.
+        fema_center (tuple): (lat, lon) that must lie inside the square.
+        halfwidth (float): Half of the square side in degrees.
+
+    Returns:
+        tuple: (lat, lon) of the best center, or (None, None) if no candidate
+        contains the FEMA center.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    # only centers whose square contains the fema center are allowed
+    cand_lats, lat_order = np.unique(lats, return_index=True)
+    keep = (cand_lats - halfwidth <= fema_center[0]) & (fema_center[0] <= cand_lats + halfwidth)
+    cand_lats, lat_order = cand_lats[keep], lat_order[keep]
+    cand_lons, lon_order = np.unique(lons, return_index=True)
+    keep = (cand_lons - halfwidth <= fema_center[1]) & (fema_center[1] <= cand_lons + halfwidth)
+    cand_lons, lon_order = cand_lons[keep], lon_order[keep]
+    if len(cand_lats) == 0 or len(cand_lons) == 0:
+        return None, None
+
+    lat_lo, lat_hi = _covering_range(cand_lats, lats, halfwidth)
+    lon_lo, lon_hi = _covering_range(cand_lons, lons, halfwidth)
+    covers = (lat_lo < lat_hi) & (lon_lo < lon_hi)
+    lat_lo, lat_hi, lon_lo, lon_hi = lat_lo[covers], lat_hi[covers], lon_lo[covers], lon_hi[covers]
+
+    diff = np.zeros((len(cand_lats) + 1, len(cand_lons) + 1), dtype=np.int32)
+    np.add.at(diff, (lat_lo, lon_lo), 1)
+    np.add.at(diff, (lat_lo, lon_hi), -1)
+    np.add.at(diff, (lat_hi, lon_lo), -1)
+    np.add.at(diff, (lat_hi, lon_hi), 1)
+    counts = diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1]
+
+    best_count = counts.max()
+    if best_count == 0:
+        return None, None
+    # among the best cells pick the one the pairwise search would have reached first
+    rows, cols = np.nonzero(counts == best_count)
+    first = np.lexsort((lon_order[cols], lat_order[rows]))[0]
+    return float(cand_lats[rows[first]]), float(cand_lons[cols[first]])
@@ -0,0 +1,333 @@
+# earth engine queries for the sentinel-2 imagery of an event
+
+import io
+
+import numpy as np
+
+try:
+    import ee
+except ImportError:
+    # only needed by EarthEngineProvider, the fake provider runs without it
+    ee = None
+
+# tried in order, the first one with images in the window is used
+SENTINEL2_COLLECTIONS = ['COPERNICUS/S2_SR_HARMONIZED', 'COPERNICUS/S2_HARMONIZED', 'COPERNICUS/S2']
+
+
+def mask_s2_clouds(image):
+  """Masks clouds in a Sentinel-2 image using the QA band.
+
+  Args:
+      image (ee.Image): A Sentinel-2 image.
+
+  Returns:
+      ee.Image: A cloud-masked Sentinel-2 image.
+  """
+  qa = image.select('QA60')
+
+  # Bits 10 and 11 are clouds and cirrus, respectively.
+  cloud_bit_mask = 1 << 10
+  cirrus_bit_mask = 1 << 11
+
+  # Both flags should be set to zero, indicating clear conditions.
+  mask = (
+      qa.bitwiseAnd(cloud_bit_mask)
+      .eq(0)
+      .And(qa.bitwiseAnd(cirrus_bit_mask).eq(0))
+  )
+
+  return image.updateMask(mask).divide(10000)
+
+
+def scene_metadata(collection):
+    # server-side lists of the image ids, acquisition dates and cloud fractions of a
+    # collection annotated by add_cloud_fraction
+    return ee.Dictionary({
+        'ids': collection.aggregate_array('system:index'),
+        'dates': collection.aggregate_array('system:time_start').map(lambda t: ee.Date(t).format('YYYY-MM-dd')),
+        'clouds': collection.aggregate_array('cloud_fraction'),
+    })
+
+
+def add_cloud_fraction(collection, region, method='metadata'):
+    """Set a ``cloud_fraction`` property (0-1) on every image of a collection.
+
+    Methods:
+        metadata: the tile-level CLOUDY_PIXEL_PERCENTAGE, no computation needed.
+        qa60: share of pixels in ``region`` flagged as cloud or cirrus in QA60.
+        probability: share of pixels in ``region`` with an S2_CLOUD_PROBABILITY
+            above 50, joined to the scenes on system:index.
+
+    Images without valid pixels in the region get a cloud fraction of 1, and
+    with 'probability', images without a cloud probability image fall back to
+    the metadata fraction.
+
+    Returns:
+        ee.ImageCollection: The annotated collection.
+    """
+    def metadata_fraction(image):
+        return ee.Number(image.get('CLOUDY_PIXEL_PERCENTAGE')).divide(100)
+
+    if method == 'metadata':
+        return collection.map(lambda image: image.set('cloud_fraction', metadata_fraction(image)))
+
+    def region_mean(cloudy, band):
+        mean = cloudy.reduceRegion(ee.Reducer.mean(), region, 60).get(band)
+        # only a missing mean means no valid pixels, If would also treat a clear 0 as false
+        return ee.Algorithms.If(ee.Algorithms.IsEqual(mean, None), 1, mean)
+
+    if method == 'qa60':
+        def qa60_fraction(image):
+            cloudy = image.select('QA60').bitwiseAnd((1 << 10) | (1 << 11)).neq(0)
+            return image.set('cloud_fraction', region_mean(cloudy, 'QA60'))
+        return collection.map(qa60_fraction)
+
+    if method == 'probability':
+        probability = ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY').filterBounds(region)
+        # outer, so scenes without a cloud probability image are kept
+        joined = ee.Join.saveFirst(matchKey='cloud_probability', outer=True).apply(
+            collection, probability, ee.Filter.equals(leftField='system:index', rightField='system:index'))
+
+        def probability_fraction(image):
+            image = ee.Image(image)
+            matched = image.get('cloud_probability')
+            cloudy = ee.Image(matched).select('probability').gt(50)
+            fraction = ee.Algorithms.If(ee.Algorithms.IsEqual(matched, None), metadata_fraction(image),
+                                        region_mean(cloudy, 'probability'))
+            return image.set('cloud_fraction', fraction)
+        return ee.ImageCollection(joined).map(probability_fraction)
+
+    raise ValueError(f"Unknown cloud fraction method {method}")
+
+
+def scene_query(region, start, end, collection_ids=SENTINEL2_COLLECTIONS, cloud_method='metadata', max_cloud=None):
+    """Build the server-side query for the scenes of one event.
+
+    The image count of every collection is computed, and the first non-empty
+    collection is chosen with ``ee.Algorithms.If``. Its scene metadata is included
+    as well, so the whole fallback resolves in one request. If ``max_cloud`` is set,
+    scenes whose cloud fraction is above it are dropped server-side, before any
+    imagery is transferred.
+
+    Args:
+        region (ee.Geometry): Area of interest.
+        start (str): Start date, YYYY-MM-DD.
+        end (str): End date (exclusive), YYYY-MM-DD.
+        collection_ids (list): Collections to try in order.
+        cloud_method (str): How the cloud fraction is computed, see ``add_cloud_fraction``.
+        max_cloud (float): Highest cloud fraction (0-1) kept, None keeps every scene.
+
+    Returns:
+        ee.Dictionary: with keys counts, collection, ids, dates and clouds.
+    """
+    filtered = [ee.ImageCollection(c).filterBounds(region).filterDate(start, end) for c in collection_ids]
+    counts = [col.size() for col in filtered]
+
+    # nest the fallbacks from the last collection outwards
+    chosen = filtered[-1]
+    chosen_id = ee.String(collection_ids[-1])
+    for col, collection_id, count in reversed(list(zip(filtered[:-1], collection_ids[:-1], counts[:-1]))):
+        chosen = ee.ImageCollection(ee.Algorithms.If(count.gt(0), col, chosen))
+        chosen_id = ee.String(ee.Algorithms.If(count.gt(0), collection_id, chosen_id))
+
+    chosen = add_cloud_fraction(chosen, region, cloud_method)
+    if max_cloud is not None:
+        chosen = chosen.filter(ee.Filter.lte('cloud_fraction', max_cloud))
+
+    return scene_metadata(chosen).combine(ee.Dictionary({
+        'counts': ee.Dictionary.fromLists(collection_ids, counts),
+        'collection': chosen_id,
+    }))
+
+
+def _unpack(info):
+    return info['collection'], list(zip(info['ids'], info['dates'], info['clouds'])), info['counts']
+
+
+def find_scenes(region, start, end, collection_ids=SENTINEL2_COLLECTIONS, cloud_method='metadata', max_cloud=None):
+    """Find the scenes of the first Sentinel-2 collection with images in the window.
+
+    Returns:
+        tuple: (collection id, list of (system:index, date, cloud fraction) tuples,
+        dict of collection id -> image count before cloud filtering). The scene
+        list is empty if no collection has usable images.
+    """
+    return _unpack(scene_query(region, start, end, collection_ids, cloud_method, max_cloud).getInfo())
+
+
+def find_scenes_batch(queries, collection_ids=SENTINEL2_COLLECTIONS, cloud_method='metadata', max_cloud=None):
+    """Run ``find_scenes`` for many events in a single request.
+
+    Args:
+        queries (list): (region, start, end) tuples.
+
+    Returns:
+        list: ``find_scenes`` results in the order of ``queries``.
+    """
+    infos = ee.List([scene_query(region, start, end, collection_ids, cloud_method, max_cloud)
+                     for region, start, end in queries]).getInfo()
+    return [_unpack(info) for info in infos]
+
+
+def group_by_day(scenes):
+    """Group scenes acquired on the same day.
+
+    Args:
+        scenes (list): (system:index, date, cloud fraction) tuples.
+
+    Returns:
+        list: (date, list of system:index, cloud fraction) tuples sorted by date. The
+        cloud fraction of a day is the lowest of its scenes.
+    """
+    days = {}
+    for image_id, date, cloud in scenes:
+        ids, clouds = days.setdefault(date, ([], []))
+        ids.append(image_id)
+        clouds.append(cloud)
+    return [(date, ids, min(clouds)) for date, (ids, clouds) in sorted(days.items())]
+
+
+def sample_scenes(days, max_scenes=8, method='even'):
+    """Keep at most ``max_scenes`` days of imagery.
+
+    Args:
+        days (list): Output of ``group_by_day``.
+        max_scenes (int): Number of days to keep, None keeps all of them.
+        method (str): 'even' keeps days evenly spaced over the window (always
+            including the first and last), 'least_cloudy' keeps the clearest days.
+
+    Returns:
+        list: The kept days, sorted by date.
+    """
+    if max_scenes is None or len(days) <= max_scenes:
+        return days
+    if method == 'least_cloudy':
+        keep = sorted(range(len(days)), key=lambda i: (days[i][2], i))[:max_scenes]
+    elif method == 'even':
+        keep = np.linspace(0, len(days) - 1, max_scenes).round().astype(int)
+    else:
+        raise ValueError(f"Unknown sampling method {method}")
+    return [days[i] for i in sorted(set(keep))]
+
+
+def day_image(collection_id, ids, mosaic=True):
+    # the image for one day, a server-side mosaic if several tiles were acquired
+    images = [ee.Image(f'{collection_id}/{image_id}') for image_id in ids]
+    if len(images) == 1 or not mosaic:
+        return images[0]
+    return ee.ImageCollection.fromImages(images).mosaic()
+
+
+def rgb_qa_params(region, dimensions='512x512', crs=None):
+    # download parameters for the rgb bands and QA60 of a scene as a single NPY array
+    params = {'bands': ['B4', 'B3', 'B2', 'QA60'], 'region': region, 'dimensions': dimensions, 'format': 'NPY'}
+    if crs is not None:
+        params['crs'] = crs
+    return params
+
+
+def decode_rgb_qa(data, vmin=0, vmax=3000):
+    """Split an NPY download of B4, B3, B2 and QA60 into an image and a cloud mask.
+
+    The rgb bands get the same linear stretch as the ``getThumbURL`` visualization
+    (min 0, max 3000, gamma 1). The mask is computed from QA60 bits 10 (opaque
+    clouds) and 11 (cirrus): clear pixels are 255 and cloudy ones 0.
+
+    Args:
+        data (bytes): Body of the ``getDownloadURL`` response, or None.
+
+    Returns:
+        tuple: (uint8 rgb array, uint8 mask array), or (None, None) if the data
+        could not be decoded.
+    """
+    if data is None:
+        return None, None
+    try:
+        bands = np.load(io.BytesIO(data))
+        rgb = np.stack([bands[b] for b in ('B4', 'B3', 'B2')], axis=-1).astype(np.float32)
+        qa = bands['QA60'].astype(np.int64)
+    except Exception as e:
+        print("Error decoding download:", e)
+        return None, None
+    rgb = np.clip(np.round((rgb - vmin) / (vmax - vmin) * 255), 0, 255).astype(np.uint8)
+    clear = ((qa & (1 << 10)) == 0) & ((qa & (1 << 11)) == 0)
+    return rgb, np.where(clear, 255, 0).astype(np.uint8)
+
+
+class ImageryProvider:
+    """Interface for the backends get_images reads scenes and thumbnails from.
+
+    Boxes are (min_lon, min_lat, max_lon, max_lat) tuples. The ``*_url`` methods
+    may block (Earth Engine generates urls with a request) and return a url whose
+    body is the image.
+    """
+
+    def find_scenes(self, box, start, end, cloud_method='metadata', max_cloud=None):
+        """Find the scenes over ``box`` between ``start`` and ``end``.
+
+        Returns:
+            tuple: (collection id, list of (scene id, date, cloud fraction) tuples,
+            dict of collection id -> image count), as ``find_scenes``.
+        """
+        raise NotImplementedError
+
+    def thumbnail_url(self, collection_id, date, ids, box, dimensions='512x512', crs=None, cloud=False, mosaic=True):
+        """Url of the rgb (or, with ``cloud``, the cloud-masked) jpeg thumbnail of a day.
+
+        Args:
+            collection_id (str): Collection returned by ``find_scenes``.
+            date (str): Acquisition date, YYYY-MM-DD.
+            ids (list): Scene ids of that day, from ``find_scenes``.
+            box (tuple): Area of the thumbnail.
+            dimensions (str): Thumbnail size, WIDTHxHEIGHT.
+            crs (str): Projection of the thumbnail, the backend default if None.
+            cloud (bool): Return the cloud-masked thumbnail.
+            mosaic (bool): Mosaic the scenes of the day, otherwise use the first one.
+        """
+        raise NotImplementedError
+
+    def download_url(self, collection_id, date, ids, box, dimensions='512x512', crs=None, mosaic=True):
+        """Url of the B4, B3, B2 and QA60 bands of a day as NPY, see ``decode_rgb_qa``."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class EarthEngineProvider(ImageryProvider):
+    """Sentinel-2 scenes and thumbnails from Google Earth Engine.
+
+    Args:
+        project (str): Google Cloud project used to initialize Earth Engine.
+        collection_ids (list): Collections to try in order.
+    """
+
+    def __init__(self, project='your-project-id', collection_ids=SENTINEL2_COLLECTIONS):
+        if ee is None:
+            raise ImportError("EarthEngineProvider requires earthengine-api")
+        ee.Initialize(project=project)
+        self.collection_ids = collection_ids
+
+    @staticmethod
+    def region(box):
+        return ee.Geometry.Rectangle([[box[0], box[1]], [box[2], box[3]]])
+
+    def find_scenes(self, box, start, end, cloud_method='metadata', max_cloud=None):
+        return find_scenes(self.region(box), start, end, self.collection_ids, cloud_method, max_cloud)
+
+    def thumbnail_url(self, collection_id, date, ids, box, dimensions='512x512', crs=None, cloud=False, mosaic=True):
+        image = day_image(collection_id, ids, mosaic)
+        if cloud:
+            # find where QA60 band is and create a black and white image as cloud mask
+            image = mask_s2_clouds(image)
+            params = {'min': 0, 'max': 100, 'gamma': 1}
+        else:
+            params = {'bands': ['B4', 'B3', 'B2'], 'min': 0, 'max': 3000, 'gamma': 1}
+        params.update({'dimensions': dimensions, 'region': self.region(box)})
+        if crs is not None:
+            params['crs'] = crs
+        return image.getThumbURL(params)
+
+    def download_url(self, collection_id, date, ids, box, dimensions='512x512', crs=None, mosaic=True):
+        image = day_image(collection_id, ids, mosaic)
+        return image.getDownloadURL(rgb_qa_params(self.region(box), dimensions, crs))
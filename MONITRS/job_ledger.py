@@ -0,0 +1,113 @@
+# sqlite ledger of the per-event, per-stage progress of get_article_aggregate_locations.py
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def inputs_hash(*values):
+    # stable hash of json serializable values, tuples and lists hash the same
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class JobLedger:
+    """Status, inputs hash and outputs of every (event, stage) pair.
+
+    A stage is either running, done (its outputs are stored as JSON), dropped (it
+    ran and had nothing to pass on, e.g. no images in the window) or failed. On a
+    restart, done and dropped stages whose inputs hash is unchanged are not run
+    again, while failed, interrupted (still running) and changed ones are.
+
+    Args:
+        path (str): Path to the SQLite database.
+    """
+
+    def __init__(self, path='jobs.sqlite'):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS jobs (event INTEGER, stage TEXT, status TEXT, inputs_hash TEXT, "
+                          "outputs TEXT, error TEXT, updated_at REAL, PRIMARY KEY (event, stage))")
+        self.conn.commit()
+
+    def _set(self, event, stage, status, inputs, outputs=None, error=None):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (event, stage, status, inputs, outputs, error, time.time()))
+            self.conn.commit()
+
+    def get(self, event, stage):
+        """Look up a stage of an event.
+
+        Returns:
+            tuple: (status, inputs hash, outputs dict or None), or None if the stage never ran.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT status, inputs_hash, outputs FROM jobs WHERE event = ? AND stage = ?",
+                                    (event, stage)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], None if row[2] is None else json.loads(row[2])
+
+    def start(self, event, stage, inputs):
+        self._set(event, stage, 'running', inputs)
+
+    def finish(self, event, stage, inputs, outputs):
+        self._set(event, stage, 'done', inputs, json.dumps(outputs))
+
+    def drop(self, event, stage, inputs):
+        self._set(event, stage, 'dropped', inputs)
+
+    def fail(self, event, stage, inputs, error):
+        self._set(event, stage, 'failed', inputs, error=str(error))
+
+    def summary(self):
+        # stage -> status -> number of events
+        with self.lock:
+            rows = self.conn.execute("SELECT stage, status, COUNT(*) FROM jobs GROUP BY stage, status").fetchall()
+        summary = {}
+        for stage, status, count in rows:
+            summary.setdefault(stage, {})[status] = count
+        return summary
+
+    def track(self, stage, fn, inputs, outputs, extra=(), decode=None):
+        """Wrap a pipeline stage so its results are recorded and reused.
+
+        Args:
+            stage (str): Stage name in the ledger.
+            fn (callable): Stage function taking and returning an event dict (or None).
+            inputs (list): Event keys the stage reads, hashed with ``extra``.
+            outputs (list): Event keys the stage adds, stored as JSON.
+            extra (tuple): Settings that change the outputs, e.g. download options.
+            decode (callable): Turns the stored outputs back into their original
+                types (JSON has no tuples).
+
+        Returns:
+            callable: The wrapped stage function.
+        """
+        def run(event):
+            event_index = event['index']
+            digest = inputs_hash([event.get(key) for key in inputs], list(extra))
+            previous = self.get(event_index, stage)
+            if previous is not None and previous[1] == digest:
+                if previous[0] == 'done':
+                    event.update(decode(previous[2]) if decode else previous[2])
+                    return event
+                if previous[0] == 'dropped':
+                    return None
+            self.start(event_index, stage, digest)
+            try:
+                result = fn(event)
+            except Exception as e:
+                self.fail(event_index, stage, digest, e)
+                raise
+            if result is None:
+                self.drop(event_index, stage, digest)
+                return None
+            self.finish(event_index, stage, digest, {key: result[key] for key in outputs})
+            return result
+        return run
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,104 @@
+# staged pipeline with bounded queues, used to overlap the remote services of get_article_aggregate_locations.py
+
+import queue
+import threading
+import time
+from collections import defaultdict
+
+_DONE = object()
+
+
+class Stage:
+    """One step of a Pipeline.
+
+    Args:
+        name (str): Name used in the report.
+        fn (callable): Called with an item, returns the item handed to the next
+            stage, or None to drop it.
+        workers (int): Number of threads running ``fn``.
+    """
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class Pipeline:
+    """Run items through a sequence of stages, each with its own worker threads.
+
+    Stages are connected by queues holding at most ``queue_size`` items. A slow stage
+    blocks the stages before it instead of letting items pile up in memory, while
+    the other stages keep working on other items, so different remote services are
+    busy at the same time. An exception raised by a stage is printed and the item
+    is dropped, like the ``continue`` of a sequential loop.
+
+    Args:
+        stages (list): Stage objects, in order.
+        queue_size (int): Capacity of each queue between two stages.
+    """
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.dropped = defaultdict(int)
+        self.busy = defaultdict(float)
+
+    def _work(self, stage, inbox, outbox, remaining):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                with self.lock:
+                    remaining[stage.name] -= 1
+                    last = remaining[stage.name] == 0
+                # the last worker of a stage to finish closes the next queue
+                (outbox if last else inbox).put(_DONE)
+                return
+            start = time.perf_counter()
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                print(f"Error in stage {stage.name}: {e}")
+                result = None
+            with self.lock:
+                self.counts[stage.name] += 1
+                self.dropped[stage.name] += result is None
+                self.busy[stage.name] += time.perf_counter() - start
+            if result is not None:
+                outbox.put(result)
+
+    def _feed(self, items, inbox):
+        for item in items:
+            inbox.put(item)
+        inbox.put(_DONE)
+
+    def run(self, items):
+        """Push ``items`` through the stages.
+
+        Yields:
+            Items that made it through every stage, in completion order.
+        """
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        remaining = {stage.name: stage.workers for stage in self.stages}
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+        for stage, inbox, outbox in zip(self.stages, queues, queues[1:]):
+            threads.extend(threading.Thread(target=self._work, args=(stage, inbox, outbox, remaining), daemon=True)
+                           for _ in range(stage.workers))
+        for thread in threads:
+            thread.start()
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            yield item
+        for thread in threads:
+            thread.join()
+
+    def report(self):
+        for stage in self.stages:
+            count = self.counts[stage.name]
+            busy = self.busy[stage.name]
+            print(f"{stage.name}: {count} items, {self.dropped[stage.name]} dropped, "
+                  f"{busy / max(count, 1):.2f}s per item, {stage.workers} workers")
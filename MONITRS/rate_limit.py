@@ -0,0 +1,33 @@
+# rate limiting shared by the workers calling an external api
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by all workers calling the same api.
+
+    Args:
+        rate (float): Number of requests allowed per second.
+        capacity (int): Maximum number of requests that can be issued in a burst.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # block until a token is available, then consume it
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
@@ -0,0 +1,114 @@
+# structured event records, written as json lines (or parquet) instead of python reprs in csv lines
+
+import json
+import re
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # only needed to read and write .parquet files
+    pyarrow = None
+
+DATED_STATEMENT = re.compile(r'(\d{4}-\d{2}-\d{2}):\s*(.*?)(?=\s*\d{4}-\d{2}-\d{2}:|$)')
+
+
+def parse_dated_statements(text):
+    """Split 'YYYY-MM-DD: statement YYYY-MM-DD: statement' text into dated statements.
+
+    Returns:
+        list: dicts with keys date and statement, in text order.
+    """
+    return [{'date': match.group(1), 'statement': match.group(2).strip()}
+            for match in DATED_STATEMENT.finditer(text)]
+
+
+def clean_location_name(name):
+    # names come from splitting the gemini response and keep its quotes and spaces
+    return name.strip().strip('"\'').strip()
+
+
+def event_record(index, links, center, locations, statements_text):
+    """Build the record of an event written by get_article_aggregate_locations.py.
+
+    Args:
+        index (int): FEMA index of the event.
+        links (list): Article urls.
+        center (tuple): (lat, lon) of the images, or None.
+        locations (dict): Location name -> (lat, lon).
+        statements_text (str): Gemini response with the statements for the image dates.
+
+    Returns:
+        dict: with keys id, links, center ([lat, lon] or None), locations (list of
+        dicts with name, lat and lon), statements (list of dicts with date and
+        statement) and statements_text (the response as returned).
+    """
+    return {
+        'id': int(index),
+        'links': list(links),
+        'center': None if center is None or center[0] is None else [float(center[0]), float(center[1])],
+        'locations': [{'name': clean_location_name(name), 'lat': float(lat), 'lon': float(lon)}
+                      for name, (lat, lon) in (locations or {}).items()],
+        'statements': parse_dated_statements(statements_text),
+        'statements_text': statements_text,
+    }
+
+
+def record_line(record):
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def write_records(records, path):
+    """Write records to a .jsonl file, or a .parquet file if pyarrow is installed."""
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            raise ImportError("writing parquet records requires pyarrow")
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(records), path)
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(record_line(record))
+
+
+def read_records(path):
+    """Read the records of a .jsonl or .parquet file.
+
+    Returns:
+        list: The records as dicts.
+    """
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            raise ImportError("reading parquet records requires pyarrow")
+        return pyarrow.parquet.read_table(path).to_pylist()
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def line_id(line):
+    # event id of a record line, or of a line in the old csv format
+    if line.startswith('{'):
+        return str(json.loads(line)['id'])
+    return line.split(',')[0]
+
+
+def to_event_data(record, no_event_phrases=('No events', 'No specific event')):
+    """Convert a record to the dict the MONITRS_QA scripts build from a csv line.
+
+    Args:
+        record (dict): Event record, or its json line.
+        no_event_phrases (tuple): Statements containing one of these are left out.
+
+    Returns:
+        dict: with keys id, url, base_coordinates, locations and events.
+    """
+    if isinstance(record, str):
+        record = json.loads(record)
+    center = record['center']
+    return {
+        'id': str(record['id']),
+        'url': record['links'][0] if record['links'] else '',
+        'base_coordinates': None if center is None else (center[0], center[1]),
+        'locations': {location['name']: (location['lat'], location['lon']) for location in record['locations']},
+        'events': [{'date': s['date'], 'event': s['statement']} for s in record['statements']
+                   if not any(phrase in s['statement'] for phrase in no_event_phrases)],
+    }
@@ -0,0 +1,152 @@
+# shared cache of downloaded sentinel-2 tiles, indexed by area and date
+
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+from os.path import join, isdir, isfile
+
+import numpy as np
+from PIL import Image
+
+
+class TileCache:
+    """On-disk cache of Sentinel-2 tiles shared by neighbouring events.
+
+    Event boxes are snapped to a grid of ``tile_size`` degree tiles laid out every
+    ``stride`` degrees, so a box of up to ``tile_size - stride`` degrees always fits
+    in the tile of its grid cell and events within the same cell share it. Tiles are
+    downloaded once per date at ``pixels`` resolution in EPSG:4326, where pixel
+    positions are linear in lon/lat, and each event crops its own box out of them.
+
+    Tiles are stored as lossless png files and indexed in a SQLite R*Tree over
+    (lon, lat, day), so cached tiles containing a box on a date are found with an
+    index lookup whatever grid they were cut on.
+
+    Args:
+        root (str): Directory holding the tiles and the index.
+        tile_size (float): Side of a tile in degrees.
+        stride (float): Spacing of the tile grid in degrees.
+        pixels (int): Side of a downloaded tile in pixels.
+    """
+
+    def __init__(self, root='tile_cache', tile_size=0.2, stride=0.1, pixels=1024):
+        self.root = root
+        self.tile_size = tile_size
+        self.stride = stride
+        self.pixels = pixels
+        if not isdir(root):
+            os.makedirs(root)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.conn = sqlite3.connect(join(root, 'index.sqlite'), check_same_thread=False)
+        self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS tile_index USING rtree(id, min_lon, max_lon, min_lat, max_lat, min_day, max_day)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tiles (id INTEGER PRIMARY KEY, key TEXT UNIQUE, collection TEXT, date TEXT, kind TEXT, path TEXT, "
+                          "min_lon REAL, min_lat REAL, max_lon REAL, max_lat REAL)")
+        self.conn.commit()
+
+    def tile_bounds(self, box):
+        """Snap a (min_lon, min_lat, max_lon, max_lat) box to the tile containing it.
+
+        Returns:
+            tuple: (min_lon, min_lat, max_lon, max_lat) of the tile.
+        """
+        min_lon = np.floor(box[0] / self.stride) * self.stride
+        min_lat = np.floor(box[1] / self.stride) * self.stride
+        return float(min_lon), float(min_lat), float(min_lon + self.tile_size), float(min_lat + self.tile_size)
+
+    def _key(self, collection, date, kind, bounds):
+        return hashlib.sha1(f"{collection}|{date}|{kind}|{bounds}".encode('utf-8')).hexdigest()
+
+    def get(self, collection, date, kind, box):
+        """Find a cached tile containing ``box`` on ``date``.
+
+        Args:
+            collection (str): Collection (and scenes) the tile was made from.
+            date (str): Acquisition date, YYYY-MM-DD.
+            kind (str): 'rgb' or 'cloud'.
+            box (tuple): (min_lon, min_lat, max_lon, max_lat) to cover.
+
+        Returns:
+            tuple: (array, tile bounds), or None if no cached tile contains the box.
+        """
+        day = datetime.date.fromisoformat(date).toordinal()
+        with self.lock:
+            # the rtree stores float32 rounded outwards, so the exact bounds are checked again
+            rows = self.conn.execute(
+                "SELECT t.path, t.min_lon, t.min_lat, t.max_lon, t.max_lat FROM tile_index i JOIN tiles t ON t.id = i.id "
+                "WHERE i.min_lon <= ? AND i.max_lon >= ? AND i.min_lat <= ? AND i.max_lat >= ? AND i.min_day <= ? AND i.max_day >= ? "
+                "AND t.collection = ? AND t.kind = ?",
+                (box[0], box[2], box[1], box[3], day, day, collection, kind)).fetchall()
+        for path, *bounds in rows:
+            inside = (bounds[0] <= box[0] + 1e-9 and box[2] - 1e-9 <= bounds[2]
+                      and bounds[1] <= box[1] + 1e-9 and box[3] - 1e-9 <= bounds[3])
+            if inside and isfile(path):
+                return np.asarray(Image.open(path)), tuple(bounds)
+        return None
+
+    def put(self, collection, date, kind, bounds, array):
+        """Store a downloaded tile covering ``bounds``."""
+        key = self._key(collection, date, kind, bounds)
+        path = join(self.root, key[:2], f'{key}.png')
+        if not isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so readers never see a partial tile
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        # fast zlib level, the default one makes encoding a tile cost more than downloading it
+        Image.fromarray(array).save(tmp_path, format='PNG', compress_level=1)
+        os.replace(tmp_path, path)
+        day = datetime.date.fromisoformat(date).toordinal()
+        with self.lock:
+            cursor = self.conn.execute("INSERT OR IGNORE INTO tiles (key, collection, date, kind, path, min_lon, min_lat, max_lon, max_lat) "
+                                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (key, collection, date, kind, path, *bounds))
+            if cursor.rowcount:
+                self.conn.execute("INSERT INTO tile_index VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  (cursor.lastrowid, bounds[0], bounds[2], bounds[1], bounds[3], day, day))
+            self.conn.commit()
+
+    def claim(self, collection, date, bounds):
+        """Claim the download of a tile, so concurrent events fetch it only once.
+
+        Returns:
+            bool: True if the caller should download the tile and ``release`` it
+            afterwards, False if another thread was downloading it and has finished.
+        """
+        key = self._key(collection, date, None, bounds)
+        with self.lock:
+            done = self.in_flight.get(key)
+            if done is None:
+                self.in_flight[key] = threading.Event()
+                return True
+        done.wait()
+        return False
+
+    def release(self, collection, date, bounds):
+        key = self._key(collection, date, None, bounds)
+        with self.lock:
+            done = self.in_flight.pop(key, None)
+        if done is not None:
+            done.set()
+
+    def crop(self, tile, bounds, box, size=512, resample=Image.BILINEAR):
+        """Cut ``box`` out of a tile and resize it to ``size`` x ``size`` pixels.
+
+        Args:
+            tile (np.ndarray): Tile array, row 0 at the northern edge.
+            bounds (tuple): (min_lon, min_lat, max_lon, max_lat) of the tile.
+            box (tuple): (min_lon, min_lat, max_lon, max_lat) to cut out.
+            resample (int): PIL resampling filter, use NEAREST for masks.
+
+        Returns:
+            np.ndarray: The cropped image.
+        """
+        height, width = tile.shape[:2]
+        left = (box[0] - bounds[0]) / (bounds[2] - bounds[0]) * width
+        right = (box[2] - bounds[0]) / (bounds[2] - bounds[0]) * width
+        top = (bounds[3] - box[3]) / (bounds[3] - bounds[1]) * height
+        bottom = (bounds[3] - box[1]) / (bounds[3] - bounds[1]) * height
+        return np.asarray(Image.fromarray(tile).resize((size, size), resample, box=(left, top, right, bottom)))
+
+    def close(self):
+        self.conn.close()
@@ -9,6 +9,10 @@ import re
 import google.generativeai as genai
 from time import sleep
 from tqdm import tqdm
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MONITRS'))
+from records import to_event_data
 
 
 genai.configure(api_key="Your_api_key_here")
@@ -37,6 +41,9 @@ def geo_to_pixel(locations, center, radius = 5):
 
 def parse_line(line: str) -> Dict:
     """Parse a single line of the data file."""
+    # json records (reorganized_total_data.jsonl) decode directly
+    if line.startswith('{'):
+        return to_event_data(line)
     # Split line into main components
     parts = []
     
@@ -295,7 +302,8 @@ def create_training_example(task_type: "custom", question_id_base: int,
 
 if __name__ == "__main__":
     # Load the data file
-    file = open('reorganized_total_data.csv', 'r')
+    data_file = 'reorganized_total_data.jsonl' if os.path.exists('reorganized_total_data.jsonl') else 'reorganized_total_data.csv'
+    file = open(data_file, 'r')
     lines = file.readlines()
     file.close()
     
@@ -6,7 +6,11 @@ import os
 import re
 from datetime import datetime
 from copy import deepcopy
-import pandas as pd
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MONITRS'))
+from fema_metadata import FemaMetadata
+from records import line_id, to_event_data
 
 # Reuse the existing geo_to_pixel function
 def geo_to_pixel(locations, center, radius=5):
@@ -67,7 +71,9 @@ class MultipleChoiceGenerator:
         }
 
     def parse_line(self, line: str) -> Dict:
-        """Parse a single line of the data file (CSV2 format)."""
+        """Parse a single line of the data file (CSV2 format, or a json record)."""
+        if line.startswith('{'):
+            return to_event_data(line, ('No events', 'No specific event', 'No known significant events'))
         # Split line into main components
         parts = line.split(',')
         
@@ -648,12 +654,13 @@ if __name__ == "__main__":
     generator = MultipleChoiceGenerator()
     
     # Read CSV2 format
-    file = open('reorganized_total_data.csv', 'r')
+    data_file = 'reorganized_total_data.jsonl' if os.path.exists('reorganized_total_data.jsonl') else 'reorganized_total_data.csv'
+    file = open(data_file, 'r')
     lines = file.readlines()
 
     # find event types from FEMA_filtered_processed.csv
-    # read csv as csv
-    df = pd.read_csv('FEMA_filtered_processed.csv', header=0)
+    # loaded once and keyed by index
+    fema = FemaMetadata('FEMA_filtered_processed.csv')
     
 
     
@@ -667,7 +674,7 @@ if __name__ == "__main__":
     # use only ids that are in file
     ids = []
     for line in lines:
-        id_num = line.split(',')[0]
+        id_num = line_id(line)
         ids.append(id_num)
     
     image_paths = {}
@@ -677,8 +684,8 @@ if __name__ == "__main__":
     # get event type per id
     event_types = {}
     for id_num in ids:
-        # df incidentType where index is id_num
-        event_type_ind = df.loc[df['index'] == int(id_num), 'incidentType'].values[0]
+        # incidentType where index is id_num
+        event_type_ind = fema[int(id_num)]['incidentType']
         event_types[id_num] = event_type_ind
     
     print("number of image paths: ", len(image_paths))
@@ -695,7 +702,7 @@ if __name__ == "__main__":
     # use only ids that are in file
     ids = []
     for line in lines:
-        id_num = line.split(',')[0]
+        id_num = line_id(line)
         ids.append(id_num)
     image_paths = {}
     for id_num in ids: